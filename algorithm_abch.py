@@ -5,7 +5,18 @@ Description of this algorithm can be found in article:
 See details in README.md file.
 """
 from sage.all import *
+import os
+from time import time
+from multiprocessing import Pool, current_process
 from mapping import Mapping
+from truncation import ungraded, truncated_compose
+from dense import DenseEngine, dense_size, is_dense_applicable, DENSE_MEMORY
+from sparse import SparseEngine, is_sparse_applicable
+from tracer import StepTimer, phase, TIME_DIGITS
+
+
+# state of the worker process used by method 'parallel' - the mapping is sent once per worker
+_worker_state = None
 
 
 def get_terms(p):
@@ -37,27 +48,10 @@ def find_degrees(mapping):
     :param mapping: object defining mapping to inverse
     :return: tuple: (D, d, [d_1, ..., d_n])
     """
-    # we put max int value as d parameter
-    min_d = sys.maxsize
-    max_d = -1
-    lower_degrees = []
-    for f, x in zip(mapping.F, mapping.R.gens()):
-        temp_monomials = (f - x).monomials()
-        if len(temp_monomials) == 0:
-            lower_degrees.append(sys.maxsize)
-        else:
-            temp_degrees = [m.degree() for m in temp_monomials]
-            d = min(temp_degrees)
-            if d < min_d:
-                min_d = d
-            dd = max(temp_degrees)
-            if dd > max_d:
-                max_d = dd
-            lower_degrees.append(d)
-    return max_d, min_d, lower_degrees
-
-
-def seq_substitute_at_once(p, mapping, degree_limit):
+    return mapping.degrees()
+
+
+def seq_substitute_at_once(p, mapping, degree_limit, timer=None):
     """
     This function calculates value of polynomial p for arguments defined in list F.
     This function gets only these terms which degree is at most degree_limit.
@@ -66,12 +60,16 @@ def seq_substitute_at_once(p, mapping, degree_limit):
     :param p: polynomial to calculate value of
     :param mapping: object defining mapping to inverse
     :param degree_limit: maximum degree of resulting polynomial
+    :param timer: StepTimer measuring substitution and truncation, if None time isn't measured
     :return:
     """
-    return filter_terms(p(mapping.F), degree_limit)
+    with phase(timer, 'substitution'):
+        image = p(mapping.F)
+    with phase(timer, 'truncation'):
+        return filter_terms(image, degree_limit)
 
 
-def seq_substitute(p, mapping, degree_limit):
+def seq_substitute(p, mapping, degree_limit, timer=None):
     """
     This function calculates value of polynomial p for arguments defined in list F.
     This function gets only these terms which degree is at most degree_limit.
@@ -80,21 +78,68 @@ def seq_substitute(p, mapping, degree_limit):
     :param p: polynomial to calculate value of
     :param mapping: object defining mapping to inverse
     :param degree_limit: maximum degree of resulting polynomial
+    :param timer: StepTimer measuring substitution and truncation, if None time isn't measured
     :return:
     """
     temp = 0
     for term in get_terms(p):
-        temp += filter_terms(term(mapping.F), degree_limit)
+        with phase(timer, 'substitution'):
+            image = term(mapping.F)
+        with phase(timer, 'truncation'):
+            temp += filter_terms(image, degree_limit)
     return temp
 
 
-def inverse_algorithm(mapping, x, substitute, debug):
+def truncated_substitute(p, mapping, degree_limit, timer=None):
+    """
+    This function calculates value of polynomial p for arguments defined in list F.
+    This function gets only these terms which degree is at most degree_limit.
+    Contrary to seq_substitute_at_once terms of higher degree are never created.
+    :param p: polynomial to calculate value of
+    :param mapping: object defining mapping to inverse
+    :param degree_limit: maximum degree of resulting polynomial
+    :param timer: StepTimer measuring substitution (truncation is a part of it), if None time isn't measured
+    :return:
+    """
+    with phase(timer, 'substitution'):
+        return ungraded(truncated_compose(p, mapping.graded_images(degree_limit), degree_limit), mapping.R)
+
+
+def cached_substitute(p, mapping, degree_limit, timer=None):
+    """
+    This function calculates value of polynomial p for arguments defined in list F.
+    This function gets only these terms which degree is at most degree_limit.
+    Truncated images of monomials are taken from the cache shared by all coordinates and steps.
+    :param p: polynomial to calculate value of
+    :param mapping: object defining mapping to inverse
+    :param degree_limit: maximum degree of resulting polynomial
+    :param timer: StepTimer measuring substitution (truncation is a part of it), if None time isn't measured
+    :return:
+    """
+    with phase(timer, 'substitution'):
+        return mapping.power_cache(degree_limit).substitute(p)
+
+
+def checkpoint_key(mapping, index):
+    """
+    This function returns key of checkpoint of index-th coordinate
+    (the state doesn't depend on the method, so the computations can be resumed with other method)
+    :param mapping: object defining mapping to inverse
+    :param index: index of coordinate
+    :return: key of checkpoint
+    """
+    return f'{mapping.fingerprint()}.{index}'
+
+
+def inverse_algorithm(mapping, x, substitute, debug, checkpoints=None, tracer=None):
     """
     This function obtain an inverse of i-th coordinate of input polynomial mapping F
     :param mapping: object defining mapping to inverse
     :param x: coordinate to inverse
     :param substitute: function used to perform substitution (sequential vs parallel)
     :param debug: flag if debug should be printed to standard output
+    :param checkpoints: Checkpoints where state of computations is saved periodically, if None it isn't saved
+    :param tracer: Tracer recording every step, if None steps are not recorded
     :return: G_i - i-th coordinate of global inverse mapping G
     """
     if debug:
@@ -103,13 +148,10 @@ def inverse_algorithm(mapping, x, substitute, debug):
     p = x
     result = x
     step = 1
-    max_d, min_d, lower_degrees = find_degrees(mapping)
-    degree_limit = max_d**(mapping.n-1)
+    _, _, lower_degrees = find_degrees(mapping)
+    degree_limit = mapping.degree_limit()
     index = mapping.R.gens().index(x)
-    if min_d > 1:
-        steps_limit = floor((max_d**(mapping.n - 1) - lower_degrees[index])/(min_d - 1) + 1)+1
-    else:
-        steps_limit = degree_limit
+    steps_limit = mapping.steps_limit(index)
     if lower_degrees[index] == sys.maxsize:
         if debug:
             print('There is no need to perform the algorithm')
@@ -117,39 +159,214 @@ def inverse_algorithm(mapping, x, substitute, debug):
     if debug:
         print(f'Maximum number of steps: {steps_limit}')
         print(f'Inversion degree boundary: {degree_limit}')
+    if tracer is not None:
+        start = time()
+        tracer.record('start', mapping=mapping.name, coordinate=index, steps_limit=steps_limit,
+                      degree_limit=degree_limit)
+    if checkpoints is not None:
+        key = checkpoint_key(mapping, index)
+        state = checkpoints.load(key)
+        if state is not None and 'G' in state:
+            if debug:
+                print('Coordinate loaded from checkpoint')
+            if tracer is not None:
+                tracer.record('end', mapping=mapping.name, coordinate=index, reason='checkpoint')
+            return state['G']
+        if state is not None:
+            step, p, result = state['step'], state['P'], state['result']
+            if debug:
+                print(f'Resuming from checkpoint at step {step}')
     while True:
-        p -= substitute(p, mapping, degree_limit)
+        timer = StepTimer() if tracer is not None else None
+        p -= substitute(p, mapping, degree_limit, timer)
         result += p
 
         if p == 0:
             if debug:
                 print(f'P_{step} = 0')
-            return result
-        else:
+            reason = 'zero'
+            if tracer is not None:
+                tracer.record('step', mapping=mapping.name, coordinate=index, step=step, terms=0, degree=None,
+                              ldegree=None, **timer.summary())
+            break
+        elif debug or tracer is not None:
+            # degrees are computed only when they are printed or recorded
             degrees = [m.degree() for m in p.monomials()]
             if debug:
                 print(f'P_{step} has degree: {max(degrees)}, ldegree: {min(degrees)}, length: {len(degrees)}')
-            if step == steps_limit:
-                if debug:
-                    print('NOT PASCAL FINITE!')
-                return result
+            if tracer is not None:
+                tracer.record('step', mapping=mapping.name, coordinate=index, step=step, terms=len(degrees),
+                              degree=max(degrees), ldegree=min(degrees), **timer.summary())
+        if step == steps_limit:
+            if debug:
+                print('NOT PASCAL FINITE!')
+            reason = 'steps_limit'
+            break
         step += 1
+        if checkpoints is not None:
+            checkpoints.save(key, {'step': step, 'P': p, 'result': result})
+    if checkpoints is not None:
+        checkpoints.save(key, {'G': result}, force=True)
+    if tracer is not None:
+        tracer.record('end', mapping=mapping.name, coordinate=index, reason=reason, steps=step,
+                      duration=round(time() - start, TIME_DIGITS))
+    return result
     
     
-def algorithm(*, mapping, debug, method):
+def _init_worker(mapping, substitute, debug, checkpoints, tracer):
     """
-    This function obtain an inverse of input polynomial mapping F
-    param F: Polynomial mapping defined over ring R
+    This function initializes the worker process used by method 'parallel'
     :param mapping: object defining mapping to inverse
+    :param substitute: function used to perform substitution
     :param debug: flag if debug should be printed to standard output
-    :param method: which method algorithm should use (only acceptable method is 'parallel')
-    :return: polynomial mapping G = F^{-1}
+    :param checkpoints: Checkpoints where state of computations is saved, if None it isn't saved
+    :param tracer: Tracer recording every step, if None steps are not recorded
+    """
+    global _worker_state
+    _worker_state = (mapping, substitute, debug, checkpoints, tracer)
+
+
+def _inverse_coordinate(index):
+    """
+    This function obtains an inverse of index-th coordinate in the worker process
+    :param index: index of coordinate to inverse
+    :return: tuple (index, G_index, duration)
+    """
+    mapping, substitute, debug, checkpoints, tracer = _worker_state
+    start = time()
+    g = inverse_algorithm(mapping, mapping.R.gens()[index], substitute, debug, checkpoints, tracer)
+    return index, g, time() - start
+
+
+def parallel_stream(mapping, substitute, debug, workers=None, checkpoints=None, tracer=None):
+    """
+    This function obtains all coordinates of the inverse in the pool of processes.
+    Every coordinate G_i is computed independently and it is yielded as soon as it is computed.
+    :param mapping: object defining mapping to inverse
+    :param substitute: function used to perform substitution
+    :param debug: flag if debug should be printed to standard output
+    :param workers: number of processes, if None all cores are used
+    :param checkpoints: Checkpoints where state of computations is saved, if None it isn't saved
+    :param tracer: Tracer recording every step, if None steps are not recorded
+    :return: generator of tuples (index, G_index) in order of completion
+    """
+    if workers is None:
+        workers = os.cpu_count()
+    workers = min(workers, mapping.n)
+    if workers < 2 or current_process().daemon:
+        # daemonic processes (e.g. workers inverting reduced mappings) are not allowed to have children
+        for index, x in enumerate(mapping.R.gens()):
+            yield index, inverse_algorithm(mapping, x, substitute, debug, checkpoints, tracer)
+        return
+    start = time()
+    sequential_duration = 0
+    with Pool(workers, initializer=_init_worker, initargs=(mapping, substitute, debug, checkpoints, tracer)) as pool:
+        for index, g_i, duration in pool.imap_unordered(_inverse_coordinate, range(mapping.n)):
+            sequential_duration += duration
+            yield index, g_i
+    duration = time() - start
+    if debug:
+        print(f'Parallel inversion with {workers} processes: {duration:.4f}s, ' +
+              f'sum of coordinate durations: {sequential_duration:.4f}s, ' +
+              f'speedup: {sequential_duration / max(duration, 1e-9):.2f}')
+
+
+def parallel_algorithm(mapping, substitute, debug, workers=None, checkpoints=None, tracer=None):
+    """
+    This function obtains all coordinates of the inverse in the pool of processes (see function parallel_stream)
+    :return: list [G_1, ..., G_n]
+    """
+    g = [None] * mapping.n
+    for index, g_i in parallel_stream(mapping, substitute, debug, workers, checkpoints, tracer):
+        g[index] = g_i
+    return g
+
+
+def stream(*, mapping, debug, method, workers=None, dense_memory=DENSE_MEMORY, checkpoints=None, tracer=None):
+    """
+    This function obtains coordinates of the inverse of input polynomial mapping F one by one,
+    every coordinate is yielded as soon as it is computed (so it can be verified while next ones are computed).
+    For parameters see function algorithm.
+    :return: generator of tuples (index, G_index), with method 'parallel' in order of completion
     """
     if debug:
         print(str(mapping))
+    if 'dense' == method or not method:
+        # method 'dense' uses dense arrays within dense_memory (0 - without limit),
+        # default method uses them only if they fit into dense_memory
+        if is_dense_applicable(mapping, (dense_memory or None) if 'dense' == method else dense_memory):
+            engine = DenseEngine(mapping)
+            for index in range(mapping.n):
+                yield index, engine.inverse_coordinate(index, debug, tracer)
+            return
+        if 'dense' == method:
+            # method 'dense' never falls back to other methods
+            field = mapping.R.base_ring()
+            if not (field.is_finite() and field.is_prime_field()):
+                raise ValueError('Method dense requires mapping defined over GF(p) (use algorithm ABCH_CRT)')
+            if field.characteristic() >= 2**31:
+                raise ValueError(f'Method dense requires characteristic below 2^31, not {field.characteristic()}')
+            degree_limit = mapping.degree_limit()
+            if degree_limit < 1:
+                # identity mapping (D = -1, e.g. reduced modulo some primes) is its own inverse
+                for index, x in enumerate(mapping.R.gens()):
+                    yield index, x
+                return
+            if (degree_limit + 1) ** mapping.n >= 2**63:
+                raise MemoryError(f'Dense representation of {mapping.name} needs {degree_limit + 1}^{mapping.n} '
+                                  'coefficients per array, which exceeds 2^63')
+            size = float(dense_size(mapping, degree_limit) / 2**20)
+            raise MemoryError(f'Dense representation of {mapping.name} needs {size:.0f} MB, '
+                              f'which exceeds the limit {dense_memory} MB')
+    if 'sparse' == method:
+        if is_sparse_applicable(mapping):
+            engine = SparseEngine(mapping)
+            for index in range(mapping.n):
+                yield index, engine.inverse_coordinate(index, debug, tracer)
+            return
+        field = mapping.R.base_ring()
+        if not (field.is_finite() and field.is_prime_field()):
+            raise ValueError('Method sparse requires mapping defined over GF(p) (use algorithm ABCH_CRT)')
     if 'partial' == method:
         subs = seq_substitute
+    elif 'truncated' == method:
+        subs = truncated_substitute
+    elif 'cached' == method:
+        subs = cached_substitute
     else:
         subs = seq_substitute_at_once
-    g = [inverse_algorithm(mapping, x, subs, debug) for x in mapping.R.gens()]
+    if 'parallel' == method:
+        yield from parallel_stream(mapping, subs, debug, workers, checkpoints, tracer)
+    else:
+        for index, x in enumerate(mapping.R.gens()):
+            yield index, inverse_algorithm(mapping, x, subs, debug, checkpoints, tracer)
+    if checkpoints is not None:
+        # all coordinates are computed, so their checkpoints are no longer needed
+        for index in range(mapping.n):
+            checkpoints.remove(checkpoint_key(mapping, index))
+    if debug:
+        for degree_limit, cache in mapping.power_caches.items():
+            print(f'Cache of truncated images (degree boundary {degree_limit}): {cache.statistics()}')
+
+
+def algorithm(*, mapping, debug, method, workers=None, dense_memory=DENSE_MEMORY, checkpoints=None, tracer=None):
+    """
+    This function obtain an inverse of input polynomial mapping F
+    param F: Polynomial mapping defined over ring R
+    :param mapping: object defining mapping to inverse
+    :param debug: flag if debug should be printed to standard output
+    :param method: which method algorithm should use
+                   (acceptable methods are 'partial', 'truncated', 'cached', 'parallel', 'dense' and 'sparse')
+    :param workers: number of processes used by method 'parallel', if None all cores are used
+    :param dense_memory: memory limit (in MB) for dense representation used by default method
+                         for mappings over prime fields, 0 disables it (method 'dense' is not limited then)
+    :param checkpoints: Checkpoints where state of computations is saved periodically (methods using Sage polynomials),
+                        if None it isn't saved
+    :param tracer: Tracer recording every step of the algorithm, if None steps are not recorded
+    :return: polynomial mapping G = F^{-1}
+    """
+    g = [None] * mapping.n
+    for index, g_i in stream(mapping=mapping, debug=debug, method=method, workers=workers, dense_memory=dense_memory,
+                             checkpoints=checkpoints, tracer=tracer):
+        g[index] = g_i
     return Mapping(g, mapping.name+"^{-1}", [], 1, mapping.imaginary)
@@ -4,6 +4,7 @@ See details in README.md file.
 """
 from sage.all import *
 from mapping import Mapping
+from polynomial_parser import PolynomialParser
 import subprocess
 from tempfile import NamedTemporaryFile
 
@@ -81,14 +82,8 @@ def find_basis_maple(ring, x, y, m, method=""):
         f.flush()
         c = subprocess.run(["maple", "-qt", f.name], capture_output=True)
         temp_list = c.stdout.decode().replace("\n", "").replace("\\", "")[1:-1].split(",")
-        result = []
-        for p in temp_list:
-            r1 = ring("0")
-            temp = (str(expand(symbolic_expression(p.strip().replace("I", "PLACEHOLDER"))))).split("+")
-            for m in temp:
-                r1 += ring(m.replace("PLACEHOLDER", "I"))
-            result.append(r1)
-        return result
+        parser = PolynomialParser(ring)
+        return [parser.parse(p) for p in temp_list]
 
 
 def find_basis(ring, x, y, m, engine, method):
@@ -98,14 +93,15 @@ def find_basis(ring, x, y, m, engine, method):
         return find_basis_maple(ring, x, y, m, method)
 
     
-def algorithm(*, mapping, debug, engine="sage", method=""):
+def stream(*, mapping, debug, engine="sage", method=""):
     """
-    This function obtain an inverse of input polynomial mapping F
+    This function obtains coordinates of the inverse of input polynomial mapping F one by one.
+    The Groebner basis is computed at once, so coordinates are yielded after it is found.
     :param mapping: Object of mapping that needs to be inverted
     :param debug: flag if debug should be printed to standard output
     :param engine: which engine should be used (available are: 'sage' and 'maple')
     :param method: which method of the engine should be used
-    :return: polynomial mapping G = F^{-1}
+    :return: generator of tuples (index, G_index)
     """
     if debug:
         print(str(mapping))
@@ -126,17 +122,27 @@ def algorithm(*, mapping, debug, engine="sage", method=""):
         print("Groebner basis found")
 
     # Step 4: find inverse mapping polynomials in Groebner basis
-    result = []
-    for x in x_vars:
+    for index, x in enumerate(x_vars):
         found = False
         for b in found_basis:
             if check(ring1, b, x):
                 g = x - b
                 # Step 4.1: don't forget about changing ring
                 #           for calculated mapping
-                result.append(change_ring(ring1, mapping.R, g))
+                yield index, change_ring(ring1, mapping.R, g)
                 found = True
                 break
         assert found
 
+
+def algorithm(*, mapping, debug, engine="sage", method=""):
+    """
+    This function obtain an inverse of input polynomial mapping F
+    :param mapping: Object of mapping that needs to be inverted
+    :param debug: flag if debug should be printed to standard output
+    :param engine: which engine should be used (available are: 'sage' and 'maple')
+    :param method: which method of the engine should be used
+    :return: polynomial mapping G = F^{-1}
+    """
+    result = [g for _, g in stream(mapping=mapping, debug=debug, engine=engine, method=method)]
     return Mapping(result, mapping.name+"^{-1}", [], 1, mapping.imaginary)
@@ -2,202 +2,735 @@
 This file contains definitions of algorithms available in our program
 """
 from sage.all import *
+import gc
 import sys
 from time import time
-from multiprocessing import Process, Manager
+from functools import partial
+from multiprocessing import Process, Pool, Pipe
+from threading import Thread, Event
+from queue import Queue, Empty
 import psutil
-from memory_profiler import memory_usage
 import algorithm_abch
 import algorithm_gb
-from crt import map2dict, dict2map, dicts_union, fill_gaps, my_crt
+from dense import DENSE_MEMORY
+from result_cache import describe, NON_RESULT_OPTIONS
+from crt import map2rows, dict2map, CoefficientStore, prime_generator
+from mapping import Mapping, compact_polynomials, restore_polynomials, split_compact
+import probabilistic_check
+from probabilistic_check import ERROR_PROBABILITY
+from memory import MEMORY_INTERVAL, MEMORY_DIGITS, TREE_INTERVAL, process_tree, tree_rss, peak_rss, limit_address_space
 
 
 DURATION_DIGITS = 4
-
-
-def _algo_abch(*, mapping, debug, results, method=None, **kwargs):
+# adaptive CRT stops when the result doesn't change for this number of additional primes
+ADAPTIVE_STABLE_PRIMES = 1
+# adaptive CRT never uses more primes than this number
+ADAPTIVE_MAX_PRIMES = 64
+# results of the algorithm stored in the result cache
+CACHED_RESULTS = ['G', 'F', 'duration', 'primes_used', 'primes_stable']
+# modes of verification of the inverse: random points modulo primes (Schwartz-Zippel) or symbolic composition G(F)
+VERIFY_PROBABILISTIC = 'probabilistic'
+VERIFY_EXACT = 'exact'
+
+
+def _collect(mapping, coordinates, progress):
+    """
+    This function collects coordinates of the inverse yielded by the algorithm
+    and reports every one of them as soon as it is computed
+    :param mapping: object defining inverted mapping
+    :param coordinates: generator of tuples (index, G_index)
+    :param progress: function called with ('coordinate', index, G_index in compact form), if None nothing is reported
+    :return: tuple (polynomial mapping G = F^{-1}, time (in seconds) spent on reporting coordinates)
+    """
+    g = [None] * mapping.n
+    reporting = 0
+    for index, g_i in coordinates:
+        g[index] = g_i
+        if progress is not None:
+            # serialization and sending of the coordinate are not part of the algorithm
+            start = time()
+            progress('coordinate', index, compact_polynomials([g_i], mapping.n))
+            reporting += time() - start
+    return Mapping(g, mapping.name+"^{-1}", [], 1, mapping.imaginary), reporting
+
+
+def _algo_abch(*, mapping, debug, results, method=None, workers=None, checkpoints=None, tracer=None, progress=None,
+               **kwargs):
     """
     This function inverses input mapping using ordinary ABCH algorithm.
     For more details see README.md file
     """
     start = time()
-    g = algorithm_abch.algorithm(mapping=mapping, debug=debug, method=method)
+    g, reporting = _collect(mapping, algorithm_abch.stream(mapping=mapping, debug=debug, method=method, workers=workers,
+                                                checkpoints=checkpoints, tracer=tracer), progress)
     finish = time()
-    results['duration'] = round(finish-start, DURATION_DIGITS)
+    results['duration'] = round(finish-start-reporting, DURATION_DIGITS)
     results['G'] = g
     results['F'] = mapping
 
 
-def _algo_gb(*, mapping, debug, engine, method, results, **kwargs):
+def _algo_gb(*, mapping, debug, engine, method, results, progress=None, **kwargs):
     """
     This function inverses input mapping using algorithm based on Groebner basis.
     For more details see README.md file
     """
     start = time()
-    g = algorithm_gb.algorithm(mapping=mapping, debug=debug, engine=engine, method=method)
+    g, reporting = _collect(mapping, algorithm_gb.stream(mapping=mapping, debug=debug, engine=engine, method=method), progress)
     finish = time()
-    results['duration'] = round(finish-start, DURATION_DIGITS)
+    results['duration'] = round(finish-start-reporting, DURATION_DIGITS)
     results['G'] = g
     results['F'] = mapping
 
 
-def _algo_ff(*, mapping, debug, inversion_algorithm, results, **kwargs):
+def _invert_abch(mapping, debug, checkpoints, tracer, *, method, dense_memory=DENSE_MEMORY):
+    """
+    This function inverses reduced mapping using ABCH algorithm (used by algorithms with CRT)
+    """
+    return algorithm_abch.algorithm(mapping=mapping, debug=debug, method=method, dense_memory=dense_memory,
+                                    checkpoints=checkpoints, tracer=tracer)
+
+
+def _invert_gb(mapping, debug, checkpoints, tracer, *, engine, method):
     """
-    This function inverses input mapping using ordinary improved ABCH algorithm which uses Chinese Remainder Theorem
+    This function inverses reduced mapping using Groebner basis (used by algorithms with CRT),
+    computations of Groebner basis can't be checkpointed nor traced
+    """
+    return algorithm_gb.algorithm(mapping=mapping, debug=debug, engine=engine, method=method)
+
+
+def _invert_reduced(segre_mapping, inversion_algorithm, debug, result_cache, checkpoints, tracer, p):
+    """
+    This function performs steps 2.1 - 2.3 of the algorithm using CRT for one prime number p.
+    It can be executed in the worker process, so it returns the inversion in a compact form
+    (list of remainders of coefficients) instead of the polynomial mapping.
+    :param segre_mapping: mapping with cleared denominators
+    :param inversion_algorithm: function used to inverse reduced mapping
+    :param debug: flag if debug should be printed to standard output
+    :param result_cache: ResultCache with inversions of reduced mappings, if None results are always computed
+    :param checkpoints: Checkpoints where state of inversion is saved, if None it isn't saved
+    :param tracer: Tracer recording steps of inversion, if None steps are not recorded
+    :param p: prime number
+    :return: tuple (p, rows, flag if rows were taken from cache), for rows see function map2rows
+    """
+    # Step 2.1: reduce mapping F modulo p
+    mapping_p = segre_mapping.reduce_mapping(p)
+    if result_cache is not None:
+        # reduced mapping doesn't depend on the list of primes, so its inversion is reused by other runs
+        key = result_cache.key(mapping_p.fingerprint(), describe(inversion_algorithm))
+        rows = result_cache.get(key)
+        if rows is not None:
+            return p, rows, True
+    # Step 2.2: perform base algorithm for reduced mapping
+    g_p = inversion_algorithm(mapping_p, debug, checkpoints, tracer)
+    # Step 2.3: transform inversion of reduced mapping into rows of remainders
+    rows = map2rows(g_p.F, segre_mapping.imaginary)
+    if result_cache is not None:
+        result_cache.put(key, rows)
+    return p, rows, False
+
+
+def _invert_primes(invert, primes, workers):
+    """
+    This function inverts reduced mappings for given prime numbers
+    :param invert: function performing steps 2.1 - 2.3 for one prime number
+    :param primes: list of prime numbers
+    :param workers: number of processes, if None (or 1) reduced mappings are inverted one by one
+    :return: generator of results of invert in order of completion
+    """
+    if workers is not None and workers > 1 and len(primes) > 1:
+        # reduced mappings are independent, so they are inverted in the pool of processes
+        # and their coefficients are merged as soon as they are computed
+        with Pool(min(workers, len(primes))) as pool:
+            for result in pool.imap_unordered(invert, primes):
+                yield result
+    else:
+        for p in primes:
+            yield invert(p)
+
+
+def _algo_ff(*, mapping, debug, inversion_algorithm, results, workers=None, adaptive=False,
+             stable_primes=ADAPTIVE_STABLE_PRIMES, max_primes=ADAPTIVE_MAX_PRIMES, rational=False, result_cache=None,
+             checkpoints=None, tracer=None, progress=None, **kwargs):
+    """
+    This function inverses input mapping using ordinary improved ABCH algorithm which uses Chinese Remainder Theorem.
+    Every prime number is reported by function progress (if it isn't None) as soon as its reduced mapping is inverted.
     For more details see README.md file
     """
     start_of_all = time()
-    # Step 1: clear denominators in input mapping
-    segre_mapping = mapping.segre_homotopy()
-
-    if mapping.r == 1:
+    if rational:
+        # Step 1 is skipped - coefficients are retrieved using rational reconstruction,
+        # primes dividing denominators are not used
+        segre_mapping = mapping
         destination_mapping = mapping
     else:
-        destination_mapping = segre_mapping
-
-    map_of_coefficients = {}
-    # Step 2: for every prime number p
-    for p in segre_mapping.primes:
-        # Step 2.1: reduce mapping F modulo p
-        mapping_p = segre_mapping.reduce_mapping(p)
-        # Step 2.2: perform base algorithm for reduced mapping
-        #         Gp = algorithm_abch.algorithm(mapping_p, debug, parallel)
-        g_p = inversion_algorithm(mapping_p, debug)
-        # Step 2.3: transform inversion of reduced mapping into dictionary
-        d_p = map2dict(g_p.F, segre_mapping.imaginary, p)
-        # Step 2.4: remember the coefficients in this mapping
-        map_of_coefficients = dicts_union(map_of_coefficients, d_p)
-    # Step 3: Use Chinese Reminder Theory to obtain candidate for global inverse
-    map_of_coefficients = fill_gaps(map_of_coefficients, mapping.primes)
-    resulting_map = my_crt(map_of_coefficients)
+        # Step 1: clear denominators in input mapping
+        segre_mapping = mapping.segre_homotopy()
+
+        if mapping.r == 1:
+            destination_mapping = mapping
+        else:
+            destination_mapping = segre_mapping
+
+    store = None
+    if checkpoints is not None:
+        # remainders for primes completed before interruption
+        store_key = f'{segre_mapping.fingerprint()}.crt'
+        store = checkpoints.load(store_key)
+        if debug and store is not None:
+            print(f'Primes loaded from checkpoint: {store.primes}')
+    if store is None:
+        store = CoefficientStore(segre_mapping.imaginary)
+    invert = partial(_invert_reduced, segre_mapping, inversion_algorithm, debug, result_cache, checkpoints, tracer)
+    cached_primes = 0
+    if adaptive:
+        # Step 2 (adaptive): take next prime numbers until the result doesn't change for stable_primes primes
+        primes = (p for p in prime_generator(segre_mapping.imaginary)
+                  if segre_mapping.is_good_prime(p) and p not in store.primes)
+        used_primes = list(store.primes)
+        resulting_map = None
+        stable = 0
+        while stable < stable_primes and len(used_primes) < max_primes:
+            batch = [next(primes) for _ in range(min(workers or 1, max_primes - len(used_primes)))]
+            for p, rows, hit in _invert_primes(invert, batch, workers):
+                store.add(p, rows)
+                cached_primes += hit
+                if checkpoints is not None:
+                    checkpoints.save(store_key, store, force=True)
+                if progress is not None:
+                    progress('prime', p)
+            used_primes += batch
+            try:
+                candidate = store.crt(rational)
+            except ValueError:
+                # rational reconstruction needs more primes
+                candidate = None
+            if candidate is not None and candidate == resulting_map:
+                stable += len(batch)
+            else:
+                stable = 0
+            resulting_map = candidate
+            if debug:
+                print(f'Primes used: {len(used_primes)}, result unchanged for {stable} primes')
+        if resulting_map is None:
+            results['status'] = 'ERROR'
+            results['error'] = f'Rational reconstruction failed for {max_primes} primes (see option --max-primes)'
+            return
+        results['primes_used'] = len(used_primes)
+        results['primes_stable'] = stable >= stable_primes
+    else:
+        primes = [p for p in segre_mapping.primes if segre_mapping.is_good_prime(p)]
+        if debug and len(primes) < len(segre_mapping.primes):
+            print(f'Primes dividing denominators are skipped: {sorted(set(segre_mapping.primes) - set(primes))}')
+        # Step 2: for every prime number p
+        for p, rows, hit in _invert_primes(invert, [p for p in primes if p not in store.primes], workers):
+            # Step 2.4: remember the coefficients in this mapping
+            store.add(p, rows)
+            cached_primes += hit
+            if checkpoints is not None:
+                checkpoints.save(store_key, store, force=True)
+            if progress is not None:
+                progress('prime', p)
+        # Step 3: Use Chinese Reminder Theory to obtain candidate for global inverse
+        try:
+            resulting_map = store.crt(rational)
+        except ValueError as e:
+            # the product of primes defined for the mapping is too small for rational reconstruction,
+            # remainders are kept in the checkpoint
+            results['status'] = 'ERROR'
+            results['error'] = f'{e} (the primes defined for the mapping are not enough, see option -p)'
+            return
+    if result_cache is not None:
+        results['cached_primes'] = cached_primes
     g = dict2map(resulting_map, destination_mapping)
     finish_of_all = time()
     results['duration'] = round(finish_of_all-start_of_all, DURATION_DIGITS)
     results['F'] = destination_mapping
     results['G'] = g
+    if checkpoints is not None:
+        checkpoints.remove(store_key)
 
 
 # https://stackoverflow.com/questions/6549669/how-to-kill-process-and-child-processes-from-python
 def kill_process(process):
-    parent_process = psutil.Process(process.pid)
-    for child in parent_process.children(recursive=True):
-        child.kill()
-    parent_process.kill()
+    try:
+        parent_process = psutil.Process(process.pid)
+        for child in parent_process.children(recursive=True):
+            child.kill()
+        parent_process.kill()
+    except psutil.NoSuchProcess:
+        # the process finished in the meantime
+        pass
 
 
-def monitor_memory_usage(*, process, memory_limit, results, timeout=1, i_val=1, prefix=''):
-    if memory_limit is None:
-        return
-    results[f'{prefix}max_memory'] = -1
+def monitor_memory_usage(*, process, memory_limit, results, stop, prefix='', memory_key='max_memory'):
+    """
+    This function (executed in a thread of the supervising process) measures resident memory used by the process
+    and its descendants every MEMORY_INTERVAL seconds and kills them when the limit is exceeded
+    :param stop: event set when the process finished
+    """
     start = time()
-    while True:
-        mem = memory_usage(
-                process.pid,
-                interval=i_val,
-                timestamps=True,
-                timeout=timeout,
-                multiprocess=True,
-                include_children=True,
-                max_usage=True)
-        if mem > results[f'{prefix}max_memory']:
-            results[f'{prefix}max_memory'] = mem
-        if mem > memory_limit:
+    pids = []
+    sample = 0
+    while not stop.is_set():
+        if sample % TREE_INTERVAL == 0:
+            pids = process_tree(process.pid)
+            if not pids:
+                # the process finished
+                return
+        mem = tree_rss(pids)
+        results[memory_key] = max(results.get(memory_key, 0), round(mem, MEMORY_DIGITS))
+        if memory_limit is not None and mem > memory_limit:
             finish = time()
-            kill_process(process)
             results[f'{prefix}status'] = 'MEM'
             results[f'{prefix}duration'] = round(finish - start, DURATION_DIGITS)
+            kill_process(process)
             return
-        sleep(1)
+        sample += 1
+        stop.wait(MEMORY_INTERVAL)
 
 
-def run_algorithm(*, alg, mapping, debug, verify, method, engine, inversion_algorithm, check_jacobian,
-                  timeout, memory_limit, params):
-    with Manager() as manager:
-        try:
-            d = manager.dict()
+def _run_supervised(*, target, connection, memory_limit, address_space_limit, prefix, streaming, **kwargs):
+    """
+    This function executes target in the supervised process and sends its results (dictionary)
+    together with peak of resident memory of the process through connection.
+    If streaming is set, target gets function progress which sends partial results before the final ones.
+    """
+    if address_space_limit and memory_limit is not None:
+        limit_address_space(memory_limit)
+    if streaming:
+        kwargs['progress'] = lambda *message: connection.send(('progress', message))
+    try:
+        results = target(**kwargs)
+    except MemoryError as e:
+        results = {f'{prefix}status': 'MEM'}
+        if str(e):
+            # the algorithm refused to allocate memory above its own limit
+            results['error'] = str(e)
+    results['peak_memory'] = peak_rss()
+    connection.send(('results', results))
+    connection.close()
+
+
+def supervise(*, target, kwargs, memory_limit, timeout, results, prefix='', memory_key='max_memory',
+              address_space_limit=False, on_progress=None):
+    """
+    This function runs target in separate process under supervision (timeout and memory limit).
+    The target returns its results (dictionary), they are sent through pipe as the last action of the process
+    and merged into dictionary results. Partial results sent by the target before (see _run_supervised)
+    are passed to on_progress as soon as they are received.
+    :param target: function executed in separate process
+    :param kwargs: keyword arguments of target, with fork they are inherited by the process (not pickled)
+    :param memory_limit: memory limit (in MB), if None it isn't checked
+    :param timeout: timeout (in seconds), if None there is no limit
+    :param results: dictionary with results
+    :param prefix: prefix of keys of status and duration written by supervisor
+    :param memory_key: key of peak memory usage written by supervisor
+    :param address_space_limit: flag if memory limit is also set as limit of virtual memory of the process
+    :param on_progress: function called with partial results of the target (it gets function progress),
+                        if None the target doesn't report partial results
+    :return: True if the process sent its results
+    """
+    receiver, sender = Pipe(duplex=False)
+    process = Process(target=_run_supervised, kwargs={
+        **kwargs,
+        'target': target,
+        'connection': sender,
+        'memory_limit': memory_limit,
+        'address_space_limit': address_space_limit,
+        'prefix': prefix,
+        'streaming': on_progress is not None
+    })
+    stop = Event()
+    # the monitor writes to its own dictionary, so its late measurement (it isn't joined) doesn't change results
+    usage = {}
+    monitor = Thread(target=monitor_memory_usage, daemon=True, kwargs={
+        'process': process, 'memory_limit': memory_limit, 'results': usage, 'stop': stop, 'prefix': prefix,
+        'memory_key': memory_key})
+    # objects inherited from this process are excluded from garbage collection in the child,
+    # otherwise a full collection over the whole Sage heap can dominate short runs
+    gc.freeze()
+    process.start()
+    gc.unfreeze()
+    sender.close()
+    monitor.start()
+    received = None
+    timed_out = False
+    deadline = None if timeout is None else time() + timeout
+    try:
+        # the result is received before joining, so the process never waits for full pipe
+        while received is None:
+            if not receiver.poll(None if deadline is None else max(deadline - time(), 0)):
+                timed_out = True
+                break
+            kind, message = receiver.recv()
+            if kind == 'progress':
+                on_progress(*message)
+            else:
+                received = message
+    except EOFError:
+        # the process was killed (memory limit) or failed before sending results
+        pass
+    finally:
+        receiver.close()
+    if timed_out:
+        kill_process(process)
+        usage[f'{prefix}status'] = 'TLE'
+        usage[f'{prefix}duration'] = timeout
+    process.join()
+    stop.set()
+    results.update(usage)
+    if received is not None:
+        # the peak reported by the process catches spikes between measurements of the monitor
+        results[memory_key] = max(results.get(memory_key, 0), received.pop('peak_memory'))
+        results.update(received)
+        return True
+    if f'{prefix}status' not in results:
+        results[f'{prefix}status'] = 'ERROR'
+    return False
+
+
+def _run_algorithm(*, alg, analysis_cache, **kwargs):
+    """
+    This function runs the algorithm and saves results of analysis of the mapping
+    (e.g. degrees, Segre homotopy, reduced mappings) computed by the algorithm.
+    :return: dictionary with results, mappings F and G in compact form
+    """
+    results = {}
+    alg(results=results, **kwargs)
+    if analysis_cache is not None:
+        kwargs['mapping'].spill_analysis(analysis_cache)
+    for k in ['F', 'G']:
+        if k in results:
+            results[k] = results[k].to_compact()
+    return results
 
-            for p in params:
-                temp = params[p]
-                if temp is not None and temp != "":
-                    d[p] = temp
 
-            if timeout is not None:
-                d['timeout'] = timeout
+class CoordinateVerifier:
+    """
+    Class verifying coordinates of the inverse in a thread of the supervising process,
+    so coordinates are verified while the algorithm computes next ones.
+    Coordinates waiting for verification are checked together in one supervised process
+    (see function run_coordinates_check).
+    """
 
-            if memory_limit is not None:
-                d['memory_limit'] = memory_limit
+    def __init__(self, *, mapping, memory_limit, timeout, address_space_limit=False, callback=None,
+                 mode=VERIFY_EXACT, error_probability=ERROR_PROBABILITY):
+        """
+        :param mapping: inverted mapping F
+        :param memory_limit: memory limit (in MB) of the verifying process, if None it isn't checked
+        :param timeout: timeout (in seconds) of verification of all coordinates, if None there is no limit
+        :param address_space_limit: flag if memory limit is also set as limit of virtual memory
+        :param callback: function called with (index, status) after verification of every coordinate
+        :param mode: mode of verification (see function run_coordinates_check)
+        :param error_probability: probability that wrong coordinate is accepted by probabilistic verification
+        """
+        self.mapping = mapping
+        self.mode = mode
+        self.error_probability = error_probability
+        self.memory_limit = memory_limit
+        self.timeout = timeout
+        self.address_space_limit = address_space_limit
+        self.callback = callback
+        self.statuses = {}
+        self.results = {}
+        self.queued = set()
+        self.queue = Queue()
+        self.start = time()
+        self.thread = Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def put(self, index, g):
+        """
+        This method adds coordinate to verify (coordinates added before are skipped)
+        :param index: index of coordinate
+        :param g: coordinate of the inverse in compact form (see function compact_polynomials)
+        """
+        if index not in self.queued:
+            self.queued.add(index)
+            self.queue.put((index, g))
+
+    def _run(self):
+        """
+        This method (executed in the thread) verifies coordinates until None is taken from the queue
+        """
+        while True:
+            batch = [self.queue.get()]
+            try:
+                while True:
+                    batch.append(self.queue.get_nowait())
+            except Empty:
+                pass
+            coordinates = [c for c in batch if c is not None]
+            if coordinates:
+                self._verify(coordinates)
+            if None in batch:
+                return
+
+    def _verify(self, coordinates):
+        """
+        This method verifies coordinates in one supervised process
+        :param coordinates: list of tuples (index, G_index in compact form)
+        """
+        results = {}
+        timeout = None if self.timeout is None else round(self.timeout - (time() - self.start), DURATION_DIGITS)
+        if timeout is not None and timeout <= 0:
+            results['inverse_check_status'] = 'TLE'
+        else:
+            supervise(target=run_coordinates_check, kwargs={
+                'f': self.mapping, 'coordinates': coordinates, 'mode': self.mode,
+                'error_probability': self.error_probability},
+                      memory_limit=self.memory_limit, timeout=timeout, results=results, prefix='inverse_check_',
+                      memory_key='inversion_check_max_memory', address_space_limit=self.address_space_limit)
+        statuses = results.get('inverse_check_coordinates', {})
+        for index, _ in coordinates:
+            # coordinates not checked by the process get status of the process (e.g. TLE)
+            self.statuses[index] = statuses.get(index, results.get('inverse_check_status', 'ERROR'))
+            if self.callback is not None:
+                self.callback(index, self.statuses[index])
+        self.results['inverse_check_duration'] = round(
+                self.results.get('inverse_check_duration', 0) + results.get('inverse_check_duration', 0),
+                DURATION_DIGITS)
+        if 'inversion_check_max_memory' in results:
+            self.results['inversion_check_max_memory'] = max(self.results.get('inversion_check_max_memory', 0),
+                                                             results['inversion_check_max_memory'])
+
+    def finish(self, results):
+        """
+        This method waits for verification of all added coordinates and writes its results:
+        status OK means that all coordinates are correct, PARTIAL that verified coordinates are correct,
+        but some coordinates weren't verified (e.g. not computed before timeout), otherwise statuses
+        of coordinates are also written (None for coordinates which weren't verified)
+        :param results: dictionary with results
+        """
+        self.queue.put(None)
+        self.thread.join()
+        results.update(self.results)
+        statuses = [self.statuses.get(index) for index in range(self.mapping.n)]
+        verified = [status for status in statuses if status is not None]
+        if not verified:
+            # nothing was computed, so nothing was verified
+            return
+        if 'ANS' in verified:
+            results['inverse_check_status'] = 'ANS'
+        else:
+            results['inverse_check_status'] = next((status for status in verified if status != 'OK'),
+                                                   'OK' if len(verified) == len(statuses) else 'PARTIAL')
+        if len(verified) < len(statuses) or results['inverse_check_status'] != 'OK':
+            results['inverse_check_coordinates'] = statuses
 
-            if check_jacobian:
-                if mapping.check_jacobian():
-                    d['jacobian_check'] = 'OK'
-                else:
-                    d['jacobian_check'] = 'ERROR'
-            else:
-                d['jacobian_check'] = 'skipped'
 
-            process = Process(target=alg, kwargs={
+def run_algorithm(*, alg, mapping, debug, verify, method, engine, inversion_algorithm, check_jacobian,
+                  timeout, memory_limit, params, analysis_cache=None, result_cache=None, address_space_limit=False,
+                  on_coordinate=None, on_inverse=None, error_probability=ERROR_PROBABILITY, **options):
+    """
+    This function runs the algorithm in separate process under supervision (timeout and memory limit)
+    and optionally verifies the result.
+    Options (e.g. number of workers) are passed to the algorithm.
+    If result_cache is set, the inverse is taken from it (or stored in it after successful run).
+    Mappings F and G are received from the process in compact form (see Mapping.to_compact)
+    and they are restored only by the process verifying the result.
+    Coordinates of the inverse are received as soon as the algorithm computes them, so they are verified
+    while next ones are computed, and coordinates completed before timeout (or memory limit) are kept.
+    :param verify: mode of verification (VERIFY_PROBABILISTIC or VERIFY_EXACT, True means VERIFY_PROBABILISTIC),
+                   if False (or None) the result isn't verified
+    :param check_jacobian: mode of the check of jacobian (see function run_jacobian_check, True means
+                           VERIFY_PROBABILISTIC), if False (or None) it isn't checked,
+                           the check is executed in separate process under supervision like the algorithm
+    :param on_coordinate: function called with (index, G_index in compact form, dictionary describing coordinate)
+                          for every coordinate of the inverse as soon as it is computed (and verified),
+                          if None coordinates are not reported
+    :param on_inverse: function called with (F, G) in compact form (see Mapping.to_compact) when the algorithm
+                       computed the inverse G of mapping F (e.g. Segre homotopy of the input mapping for algorithms
+                       using CRT) and the inverse passed verification (or it wasn't verified),
+                       if None the inverse is not reported
+    :param error_probability: probability that wrong coordinate (or jacobian) is accepted by probabilistic checks
+    """
+    if verify is True:
+        verify = VERIFY_PROBABILISTIC
+    if analysis_cache is not None:
+        mapping.load_analysis(analysis_cache)
+    cache_key = None
+    if result_cache is not None:
+        # options selecting resources (e.g. number of workers) don't change the result
+        cache_key = result_cache.key(mapping.fingerprint(), describe(alg), method, engine, describe(inversion_algorithm),
+                                     sorted((k, v) for k, v in options.items() if k not in NON_RESULT_OPTIONS))
+    d = {}
+    start = time()
+    coordinates = {}
+    primes = []
+    verifier = None
+    inverse = None
+
+    def report(index, status):
+        if on_coordinate is not None:
+            on_coordinate(index, coordinates[index], {
+                'coordinate': index,
+                'elapsed': round(time() - start, DURATION_DIGITS),
+                'inverse_check_status': status
+            })
+
+    def add_coordinate(f, index, g):
+        nonlocal verifier
+        coordinates[index] = g
+        if not verify:
+            report(index, 'skipped')
+            return
+        if verifier is None:
+            verifier = CoordinateVerifier(mapping=f, memory_limit=memory_limit, timeout=timeout,
+                                          address_space_limit=address_space_limit, callback=report, mode=verify,
+                                          error_probability=error_probability)
+        verifier.put(index, g)
+
+    def on_progress(kind, *message):
+        if kind == 'coordinate':
+            # algorithms streaming coordinates invert the input mapping
+            add_coordinate(mapping, *message)
+        elif kind == 'prime':
+            primes.extend(message)
+
+    try:
+        for p in params:
+            temp = params[p]
+            if temp is not None and temp != "":
+                d[p] = temp
+
+        if timeout is not None:
+            d['timeout'] = timeout
+
+        if verify:
+            d['inverse_check_mode'] = verify
+            if verify == VERIFY_PROBABILISTIC:
+                d['inverse_check_error_probability'] = error_probability
+
+        if memory_limit is not None:
+            d['memory_limit'] = memory_limit
+
+        if check_jacobian:
+            mode = VERIFY_PROBABILISTIC if check_jacobian is True else check_jacobian
+            supervise(target=run_jacobian_check, kwargs={
+                'mapping': mapping, 'mode': mode, 'error_probability': error_probability,
+                'analysis_cache': analysis_cache
+            }, memory_limit=memory_limit, timeout=timeout, results=d, prefix='jacobian_check_',
+                memory_key='jacobian_check_max_memory', address_space_limit=address_space_limit)
+            d['jacobian_check'] = d.pop('jacobian_check_status')
+            d['jacobian_check_mode'] = mode
+        else:
+            d['jacobian_check'] = 'skipped'
+
+        if analysis_cache is not None:
+            mapping.spill_analysis(analysis_cache)
+
+        cached = result_cache.get(cache_key) if cache_key is not None else None
+        if cached is not None:
+            d.update(cached)
+            d['cache'] = 'HIT'
+        else:
+            if cache_key is not None:
+                d['cache'] = 'MISS'
+            supervise(target=_run_algorithm, kwargs={
+                'alg': alg,
+                'analysis_cache': analysis_cache,
                 'mapping': mapping,
                 'debug': debug,
                 'method': method,
                 'engine': engine,
                 'inversion_algorithm': inversion_algorithm,
-                'results': d
-            })
-            monitor = Process(target=monitor_memory_usage,
-                              kwargs={'process': process, 'memory_limit': memory_limit, 'results': d})
-            process.start()
-            monitor.start()
-            process.join(timeout)
-            if process.is_alive():
-                kill_process(process)
-                d['status'] = "TLE"
-                d['duration'] = timeout
-
-            if monitor.is_alive():
-                monitor.terminate()
-
-            if 'G' in d and 'F' in d:
-                d['status'] = 'OK'
-
-                if verify:
-                    process = Process(target=run_inverse_check, kwargs={'results': d})
-                    monitor = Process(target=monitor_memory_usage,
-                                      kwargs={'process': process, 'memory_limit': memory_limit,
-                                              'results': d, 'prefix': 'inversion_check_'})
-                    process.start()
-                    monitor.start()
-                    process.join(timeout)
-                    if process.is_alive():
-                        kill_process(process)
-                        d['inverse_check_status'] = 'TLE'
-                        d['inverse_check_duration'] = timeout
-                    if monitor.is_alive():
-                        monitor.terminate()
-                else:
-                    d['inverse_check_status'] = 'skipped'
-                del d['G']
-                del d['F']
-            return d.copy()
-        except:
-            d['status'] = 'ERROR'
-            if debug:
-                print("Unexpected error:", sys.exc_info()[0])
+                'result_cache': result_cache,
+                **options
+            }, memory_limit=memory_limit, timeout=timeout, results=d, address_space_limit=address_space_limit,
+                on_progress=on_progress)
+
+            if cache_key is not None and 'G' in d and 'F' in d:
+                result_cache.put(cache_key, {k: d[k] for k in CACHED_RESULTS if k in d})
+
+        if 'G' in d and 'F' in d:
+            d['status'] = 'OK'
+            # coordinates which weren't streamed (e.g. results of CRT or cache) are verified now
+            f = mapping if coordinates else Mapping.from_compact(d['F'])
+            for index, g in enumerate(split_compact(d['G'])):
+                if index not in coordinates:
+                    add_coordinate(f, index, g)
+            inverse = (d.pop('F'), d.pop('G'))
+        else:
+            # the algorithm didn't finish (e.g. timeout), its completed parts are kept
+            if coordinates:
+                d['completed_coordinates'] = sorted(coordinates)
+            if primes:
+                d['completed_primes'] = primes
+        if verifier is not None:
+            verifier.finish(d)
+        elif not verify and d.get('status') == 'OK':
+            d['inverse_check_status'] = 'skipped'
+        if on_inverse is not None and inverse is not None and d['inverse_check_status'] in ('OK', 'skipped'):
+            on_inverse(*inverse)
+        return d
+    except:
+        d['status'] = 'ERROR'
+        if debug:
+            print("Unexpected error:", sys.exc_info()[0])
+        # failed run is logged like other runs (without the inverse)
+        d.pop('G', None)
+        d.pop('F', None)
+        return d
+
+
+def run_jacobian_check(*, mapping, mode, error_probability, analysis_cache):
+    """
+    This function checks if determinant of Jacobi matrix of the mapping is equal to 1.
+    The determinant is checked at random points modulo random primes (see probabilistic_check.py),
+    in mode VERIFY_EXACT positive result is confirmed by the symbolic determinant
+    (mappings over finite fields are always checked symbolically).
+    :param mapping: object describing mapping
+    :param mode: mode of the check
+    :param error_probability: probability that wrong jacobian passes the check at random points
+    :param analysis_cache: directory where the symbolic determinant is saved, if None it isn't saved
+    :return: dictionary with results
+    """
+    start = time()
+    if mapping.R.base_ring().is_finite():
+        res = mapping.check_jacobian()
+    else:
+        res = probabilistic_check.check_jacobian(mapping, error_probability)
+        if res and mode == VERIFY_EXACT:
+            res = mapping.check_jacobian()
+    finish = time()
+    if analysis_cache is not None and 'jacobian_determinant' in mapping.analysis:
+        mapping.spill_analysis(analysis_cache)
+    return {
+        'jacobian_check_status': 'OK' if res else 'ERROR',
+        'jacobian_check_duration': round(finish-start, DURATION_DIGITS)
+    }
 
 
-def run_inverse_check(*, results):
-    f = results['F']
-    g = results['G']
+def run_coordinates_check(*, f, coordinates, mode=VERIFY_EXACT, error_probability=ERROR_PROBABILITY):
+    """
+    This function checks if polynomials are coordinates of the inverse of mapping f.
+    In mode VERIFY_EXACT G_i(F) is composed symbolically, in mode VERIFY_PROBABILISTIC G_i(F(a)) is compared with a_i
+    at random points modulo random primes (see probabilistic_check.py), mappings over finite fields are always
+    checked symbolically.
+    :param f: object describing mapping
+    :param coordinates: list of tuples (index, G_index in compact form)
+    :param mode: mode of verification
+    :param error_probability: probability that wrong coordinate is accepted in mode VERIFY_PROBABILISTIC
+    :return: dictionary with results, statuses of coordinates (OK or ANS) under key inverse_check_coordinates
+    """
+    results = {}
     start = time()
-    res = f.check_inversion(g)
+    if mode == VERIFY_PROBABILISTIC and not f.R.base_ring().is_finite():
+        compact = f.to_compact()
+        check = lambda index, g: probabilistic_check.check_coordinate(compact, index, g, error_probability)
+    else:
+        check = lambda index, g: f.check_coordinate(index, restore_polynomials(g)[0])
+    statuses = {}
+    for index, g in coordinates:
+        statuses[index] = 'OK' if check(index, g) else 'ANS'
     finish = time()
     results['inverse_check_duration'] = round(finish-start, DURATION_DIGITS)
-    if res:
-        results['inverse_check_status'] = 'OK'
-    else:
-        results['inverse_check_status'] = 'ANS'
+    results['inverse_check_coordinates'] = statuses
+    return results
 
 
-def algo_abch(*, mapping, debug, verify, method, check_jacobian, timeout, memory_limit, params):
+def algo_abch(*, mapping, debug, verify, method, check_jacobian, timeout, memory_limit, params, **kwargs):
     return run_algorithm(
             alg=_algo_abch,
             mapping=mapping,
@@ -209,27 +742,30 @@ def algo_abch(*, mapping, debug, verify, method, check_jacobian, timeout, memory
             check_jacobian=check_jacobian,
             timeout=timeout,
             memory_limit=memory_limit,
-            params=params
+            params=params,
+            **kwargs
     )
 
 
-def algo_abch_crt(*, debug, verify, check_jacobian, timeout, memory_limit, params, method, **kwargs):
+def algo_abch_crt(*, mapping, debug, verify, method, check_jacobian, timeout, memory_limit, params,
+                  dense_memory=DENSE_MEMORY, **kwargs):
     return run_algorithm(
             alg=_algo_ff,
-            mapping=kwargs['mapping'],
+            mapping=mapping,
             debug=debug,
             verify=verify,
             method=method,
             engine=None,
-            inversion_algorithm=lambda f, d: algorithm_abch.algorithm(mapping=f, debug=d, method=method),
+            inversion_algorithm=partial(_invert_abch, method=method, dense_memory=dense_memory),
             check_jacobian=check_jacobian,
             timeout=timeout,
             memory_limit=memory_limit,
-            params=params
+            params=params,
+            **kwargs
     )
 
 
-def algo_gb_sage(*, mapping, debug, verify, method, check_jacobian, timeout, memory_limit, params):
+def algo_gb_sage(*, mapping, debug, verify, method, check_jacobian, timeout, memory_limit, params, **kwargs):
     return run_algorithm(
             alg=_algo_gb,
             mapping=mapping,
@@ -241,11 +777,12 @@ def algo_gb_sage(*, mapping, debug, verify, method, check_jacobian, timeout, mem
             check_jacobian=check_jacobian,
             timeout=timeout,
             memory_limit=memory_limit,
-            params=params
+            params=params,
+            **kwargs
     )
 
 
-def algo_gb_sage_crt(*, mapping, debug, verify, method, check_jacobian, timeout, memory_limit, params):
+def algo_gb_sage_crt(*, mapping, debug, verify, method, check_jacobian, timeout, memory_limit, params, **kwargs):
     return run_algorithm(
             alg=_algo_ff,
             mapping=mapping,
@@ -253,15 +790,16 @@ def algo_gb_sage_crt(*, mapping, debug, verify, method, check_jacobian, timeout,
             verify=verify,
             method=method,
             engine=None,
-            inversion_algorithm=lambda f, d: algorithm_gb.algorithm(mapping=f, debug=d, engine="sage", method=method),
+            inversion_algorithm=partial(_invert_gb, engine="sage", method=method),
             check_jacobian=check_jacobian,
             timeout=timeout,
             memory_limit=memory_limit,
-            params=params
+            params=params,
+            **kwargs
     )
 
 
-def algo_gb_maple(*, mapping, debug, verify, method, check_jacobian, timeout, memory_limit, params):
+def algo_gb_maple(*, mapping, debug, verify, method, check_jacobian, timeout, memory_limit, params, **kwargs):
     return run_algorithm(
             alg=_algo_gb,
             mapping=mapping,
@@ -273,11 +811,12 @@ def algo_gb_maple(*, mapping, debug, verify, method, check_jacobian, timeout, me
             check_jacobian=check_jacobian,
             timeout=timeout,
             memory_limit=memory_limit,
-            params=params
+            params=params,
+            **kwargs
     )
 
 
-def algo_gb_maple_crt(*, mapping, debug, verify, method, check_jacobian, timeout, memory_limit, params):
+def algo_gb_maple_crt(*, mapping, debug, verify, method, check_jacobian, timeout, memory_limit, params, **kwargs):
     return run_algorithm(
             alg=_algo_ff,
             mapping=mapping,
@@ -285,16 +824,20 @@ def algo_gb_maple_crt(*, mapping, debug, verify, method, check_jacobian, timeout
             verify=verify,
             method=method,
             engine=None,
-            inversion_algorithm=lambda f, d: algorithm_gb.algorithm(mapping=f, debug=d, engine="maple", method=method),
+            inversion_algorithm=partial(_invert_gb, engine="maple", method=method),
             check_jacobian=check_jacobian,
             timeout=timeout,
             memory_limit=memory_limit,
-            params=params
+            params=params,
+            **kwargs
     )
 
 
+verification_modes = [VERIFY_PROBABILISTIC, VERIFY_EXACT]
 maple_methods = ["", "fgb", "maplef4", "buchberger", "fglm", "walk", "direct", "convert", "default"]
-sage_methods = ["", "partial"]
+sage_methods = ["", "partial", "parallel", "truncated", "cached"]
+# methods available only for reduced mappings (defined over prime fields)
+reduced_sage_methods = sage_methods + ["dense", "sparse"]
 
 
 algorithms = {
@@ -310,7 +853,7 @@ methods = {
     "GB_SAGE": [""], 
     "GB_SAGE_CRT": [""], 
     "ABCH": sage_methods,
-    "ABCH_CRT": sage_methods,
+    "ABCH_CRT": reduced_sage_methods,
     "GB_MAPLE": maple_methods,
     "GB_MAPLE_CRT": maple_methods
 }
@@ -0,0 +1,417 @@
+"""
+This file contains scheduler running many experiments (algorithms x mappings x methods) concurrently.
+Sage and mappings are loaded once, every job is executed in a forked process by the same function as in main.py,
+so timeout and memory limit work per job. Results are written to JSON lines file (one line per job).
+Instead of mappings, instances of family of mappings with parameters (template) can be studied (parameter sweep),
+instances are built from the template parsed once before jobs are forked.
+See details in README.md file.
+"""
+import os
+import json
+import textwrap
+from functools import partial
+from itertools import product
+from multiprocessing import Process, Pipe
+from multiprocessing.connection import wait
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+from mappings import mappings, templates, MappingRegistry
+from algorithms import algorithms, methods, verification_modes, VERIFY_PROBABILISTIC
+from probabilistic_check import ERROR_PROBABILITY
+from results_log import environment, now, write_record
+from memory import MIN_ADDRESS_SPACE_LIMIT
+
+
+def job_id(job):
+    """
+    This function returns identifier of the job used to find finished jobs
+    :param job: tuple (algorithm, mapping, method)
+    :return: string
+    """
+    return ':'.join(job)
+
+
+def make_jobs(list_of_algorithms, list_of_mappings, list_of_methods):
+    """
+    This function creates all combinations of algorithms, mappings and methods,
+    methods which are not available for the algorithm are skipped
+    :param list_of_algorithms: names of algorithms
+    :param list_of_mappings: names of mappings
+    :param list_of_methods: names of methods
+    :return: list of tuples (algorithm, mapping, method)
+    """
+    return [(alg, mapping, method)
+            for alg in list_of_algorithms
+            for mapping in list_of_mappings
+            for method in list_of_methods
+            if method in methods[alg]]
+
+
+def finished_jobs(path):
+    """
+    This function reads identifiers of jobs which have results in the file
+    :param path: path to JSON lines file with results
+    :return: set of identifiers
+    """
+    finished = set()
+    if not os.path.exists(path):
+        return finished
+    with open(path) as f:
+        for line in f:
+            try:
+                finished.add(json.loads(line)['job'])
+            except (ValueError, KeyError):
+                # line written by interrupted scheduler
+                continue
+    return finished
+
+
+def parse_grid(items):
+    """
+    This function creates all combinations of values of parameters
+    :param items: list of strings NAME=VALUE1,VALUE2,...
+    :return: list of dictionaries { name of parameter => value }
+    :raise ValueError: if some item is not correct
+    """
+    names = []
+    values = []
+    for item in items:
+        name, separator, listed = item.partition('=')
+        if not separator or not name or not listed:
+            raise ValueError(f'Expected NAME=VALUE1,VALUE2,... instead of {item}')
+        names.append(name.strip())
+        values.append([v.strip() for v in listed.split(',')])
+    return [dict(zip(names, combination)) for combination in product(*values)]
+
+
+def read_assignments(path):
+    """
+    This function reads values of parameters from JSON lines file (one dictionary per line)
+    :param path: path to the file
+    :return: list of dictionaries { name of parameter => value }
+    """
+    with open(path) as f:
+        return [{k: str(v) for k, v in json.loads(line).items()} for line in f if line.strip()]
+
+
+def make_instances(template, assignments):
+    """
+    This function creates registry of instances of the family of mappings, instances are built at once
+    (so they are shared by forked jobs) and incorrect values of parameters are detected before jobs start
+    :param template: object describing family of mappings
+    :param assignments: list of dictionaries { name of parameter => value }
+    :return: tuple (registry of instances, { name of instance => values of parameters })
+    :raise ValueError: if some values of parameters are not correct
+    """
+    instances = MappingRegistry()
+    values = {}
+    for assignment in assignments:
+        name = template.instance_name(assignment)
+        if name not in values:
+            instances.register(name)(partial(template.instance, assignment))
+            values[name] = assignment
+    for name in instances:
+        instances[name]
+    return instances, values
+
+
+def run_job(*, job, settings, connection, registry=mappings):
+    """
+    This function executes the job (in separate process) and sends its result
+    :param job: tuple (algorithm, mapping, method)
+    :param settings: dictionary with arguments of the algorithm (verify, check_jacobian, timeout, ...)
+    :param connection: connection used to send the result
+    :param registry: registry of mappings containing the mapping
+    """
+    alg, mapping, method = job
+    result = algorithms[alg](
+            mapping=registry[mapping],
+            debug=False,
+            method=method,
+            params={"algorithm": alg, "mapping": mapping, "method": method, "workers": settings.get('workers')},
+            **settings
+    )
+    connection.send(result if result is not None else {'status': 'ERROR'})
+
+
+def schedule(jobs, *, cores, memory, settings, output, resume=False, registry=mappings, descriptions=None):
+    """
+    This function runs jobs concurrently, so they fit into global budgets of cores and memory.
+    Every job uses -w cores (one by default) and reserves its memory limit.
+    A job which doesn't fit into budgets alone is executed when no other job is running.
+    :param jobs: list of tuples (algorithm, mapping, method)
+    :param cores: number of cores which can be used by all jobs
+    :param memory: memory (in MB) which can be reserved by all jobs, if None it isn't limited
+    :param settings: dictionary with arguments of the algorithm (verify, check_jacobian, timeout, memory_limit, ...)
+    :param output: path to JSON lines file with results
+    :param resume: flag if jobs which have results in output file should be skipped
+    :param registry: registry of mappings containing mappings of the jobs
+    :param descriptions: dictionary { name of mapping => dictionary } with additional values logged for the mapping
+                         (e.g. template and values of parameters), if None nothing is added
+    """
+    if resume:
+        finished = finished_jobs(output)
+        pending = [job for job in jobs if job_id(job) not in finished]
+        print(f'Skipping {len(jobs) - len(pending)} finished jobs')
+    else:
+        pending = list(jobs)
+    job_cores = settings.get('workers') or 1
+    job_memory = settings.get('memory_limit') or 0
+    running = {}
+    env = environment()
+    with open(output, "a") as results_file:
+        while pending or running:
+            while pending:
+                used_cores = len(running) * job_cores
+                used_memory = len(running) * job_memory
+                if running and (used_cores + job_cores > cores or
+                                (memory is not None and used_memory + job_memory > memory)):
+                    break
+                job = pending.pop(0)
+                receiver, sender = Pipe(duplex=False)
+                process = Process(target=run_job, kwargs={'job': job, 'settings': settings, 'connection': sender,
+                                                          'registry': registry})
+                process.start()
+                sender.close()
+                begin = now()
+                running[receiver] = (process, job, begin)
+            # the result is received before joining, so the job never waits for full pipe
+            for receiver in wait(list(running.keys())):
+                process, job, begin = running.pop(receiver)
+                try:
+                    result = receiver.recv()
+                except EOFError:
+                    # the job process died without sending result
+                    result = {'status': 'ERROR'}
+                receiver.close()
+                process.join()
+                record = {
+                    'job': job_id(job),
+                    'begin': begin,
+                    'end': now(),
+                    'environment': env,
+                    **(descriptions or {}).get(job[1], {}),
+                    **result
+                }
+                print(write_record(results_file, record))
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(
+            prog="sage batch.py",
+            formatter_class=RawDescriptionHelpFormatter,
+            epilog=textwrap.dedent('''
+            This is application to run many experiments (algorithms x mappings x methods) concurrently,
+            also for many values of parameters of family of mappings (option --template).
+
+            For details see file README.md.
+            '''))
+    parser.add_argument(
+            "-a", "--algorithm",
+            metavar="ALG",
+            nargs='+',
+            type=str,
+            help="Choose algorithms to run",
+            choices=list(algorithms.keys()),
+            required=True
+    )
+    mapping_source = parser.add_mutually_exclusive_group(required=True)
+    mapping_source.add_argument(
+            "-m", "--mapping",
+            metavar="MAPPING",
+            nargs='+',
+            type=str,
+            help="Choose mappings to study",
+            choices=list(mappings.keys())
+    )
+    mapping_source.add_argument(
+            "--template",
+            metavar="TEMPLATE",
+            nargs=1,
+            type=str,
+            help="Choose family of mappings with parameters, its instances are studied (parameter sweep)",
+            choices=list(templates.keys())
+    )
+    values_source = parser.add_mutually_exclusive_group()
+    values_source.add_argument(
+            "--grid",
+            metavar="NAME=VALUES",
+            nargs='+',
+            type=str,
+            help="Values of parameters of the template (comma separated), all combinations are studied, " +
+                 "other parameters have default values",
+            default=None
+    )
+    values_source.add_argument(
+            "--assignments",
+            metavar="FILE",
+            nargs=1,
+            type=str,
+            help="JSON lines file with values of parameters of the template (one dictionary per line)",
+            default=None
+    )
+    parser.add_argument(
+            "-e", "--method",
+            metavar="METHOD",
+            nargs='+',
+            type=str,
+            help="Choose methods, methods which are not available for the algorithm are skipped, " +
+                 "default value is '' (default method)",
+            default=[''],
+            required=False
+    )
+    parser.add_argument(
+            "-v", "--verify",
+            metavar="MODE",
+            nargs='?',
+            type=str,
+            help="Turn on verifying if result is inversion: 'probabilistic' (default) evaluates G(F(a)) " +
+                 "at random points modulo random primes, 'exact' composes G(F) symbolically",
+            choices=verification_modes,
+            const=VERIFY_PROBABILISTIC,
+            default=None
+    )
+    parser.add_argument(
+            "--error-probability",
+            metavar="P",
+            nargs=1,
+            type=float,
+            help="Probability that wrong coordinate of the inverse (or wrong jacobian) passes probabilistic check, " +
+                 f"default value is {ERROR_PROBABILITY}",
+            default=None
+    )
+    parser.add_argument(
+            "-j", "--jacobian",
+            metavar="MODE",
+            nargs='?',
+            type=str,
+            help="Turn on checking if jacobian is constant (equal to 1): 'probabilistic' (default) computes " +
+                 "the determinant at random points modulo random primes, 'exact' confirms it symbolically",
+            choices=verification_modes,
+            const=VERIFY_PROBABILISTIC,
+            default=None
+    )
+    parser.add_argument(
+            '-t', '--timeout',
+            metavar="SECONDS",
+            nargs=1,
+            type=int,
+            help="Timeout of every job, default value is None - it means no limit",
+            default=None,
+            required=False
+    )
+    parser.add_argument(
+            '-r', '--memory',
+            metavar="MB",
+            nargs=1,
+            type=int,
+            help="Memory limit of every job",
+            default=None,
+            required=False
+    )
+    parser.add_argument(
+            "--hard-memory-limit",
+            action="store_true",
+            help="Set memory limit of every job also as limit of virtual memory (RLIMIT_AS) of its processes " +
+                 "(the limit must be at least 2048 MB)",
+            default=False
+    )
+    parser.add_argument(
+            '-w', '--workers',
+            metavar="N",
+            nargs=1,
+            type=int,
+            help="Number of processes used by every job (see main.py), default value is None - one process",
+            default=None,
+            required=False
+    )
+    parser.add_argument(
+            '-p', '--adaptive-primes',
+            action="store_true",
+            help="Algorithms using CRT take prime numbers from generator (instead of list defined for the mapping) " +
+                 "until the result doesn't change (see main.py), needed when values of parameters of the template " +
+                 "make coefficients of the inverse bigger",
+            default=False
+    )
+    parser.add_argument(
+            '--cores',
+            metavar="N",
+            nargs=1,
+            type=int,
+            help="Number of cores used by all jobs together, default value is number of cores of the machine",
+            default=None,
+            required=False
+    )
+    parser.add_argument(
+            '--total-memory',
+            metavar="MB",
+            nargs=1,
+            type=int,
+            help="Memory which can be reserved by all jobs together (every job reserves its memory limit), " +
+                 "default value is None - it means no limit",
+            default=None,
+            required=False
+    )
+    parser.add_argument(
+            "-o", "--output",
+            metavar="FILE",
+            nargs=1,
+            type=str,
+            help="File with results (JSON lines), default value is batch.jsonl",
+            default=["batch.jsonl"],
+            required=False
+    )
+    parser.add_argument(
+            '--resume',
+            action="store_true",
+            help="Skip jobs which already have results in output file",
+            default=False
+    )
+    args = parser.parse_args()
+
+    if args.hard_memory_limit and (not args.memory or args.memory[0] < MIN_ADDRESS_SPACE_LIMIT):
+        parser.error(f"option --hard-memory-limit requires option -r with at least {MIN_ADDRESS_SPACE_LIMIT} MB " +
+                     "(virtual memory of a fresh Sage process is about 1.7 GB)")
+
+    if args.template is None:
+        if args.grid is not None or args.assignments is not None:
+            parser.error("options --grid and --assignments require option --template")
+        registry = mappings
+        names = args.mapping
+        descriptions = None
+    else:
+        template = templates[args.template[0]]
+        try:
+            if args.grid is not None:
+                assignments = parse_grid(args.grid)
+            elif args.assignments is not None:
+                assignments = read_assignments(args.assignments[0])
+            else:
+                assignments = [{}]
+            registry, values = make_instances(template, assignments)
+        except ValueError as e:
+            parser.error(str(e))
+        names = list(registry)
+        descriptions = {name: {'template': template.name, 'params': values[name]} for name in names}
+
+    settings = {
+        'verify': args.verify,
+        'error_probability': args.error_probability[0] if args.error_probability else ERROR_PROBABILITY,
+        'check_jacobian': args.jacobian,
+        'timeout': args.timeout[0] if args.timeout is not None else None,
+        'memory_limit': args.memory[0] if args.memory is not None else None,
+        'address_space_limit': args.hard_memory_limit,
+        'workers': args.workers[0] if args.workers is not None else None
+    }
+    if args.adaptive_primes:
+        settings['adaptive'] = True
+
+    schedule(
+            make_jobs(args.algorithm, names, args.method),
+            cores=args.cores[0] if args.cores is not None else os.cpu_count(),
+            memory=args.total_memory[0] if args.total_memory is not None else None,
+            settings=settings,
+            output=args.output[0],
+            resume=args.resume,
+            registry=registry,
+            descriptions=descriptions
+    )
@@ -0,0 +1,289 @@
+"""
+This file contains micro-benchmarks comparing alternative implementations of parts of our program
+"""
+from sage.all import *
+import json
+import os
+import subprocess
+import sys
+import textwrap
+from tempfile import TemporaryDirectory
+from time import time
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+from crt import batched_crt
+import algorithm_abch
+from dense import is_dense_applicable
+from mappings import mappings
+from mapping import Mapping
+from mapping_file import save_mapping, load_compact, load_mapping
+
+
+DURATION_DIGITS = 4
+
+
+def fill_gaps(coefficients, list_of_primes):
+    """
+    This function adds zero remainders for primes missing in the lists of remainders
+    :param coefficients: Dictionary in form { (i, a) => [(p_1, c_1), (p_2, c_2), ...] }, it is modified
+    :param list_of_primes: list of prime numbers
+    :return: coefficients
+    """
+    for list_of_coefficients in coefficients.values():
+        present = {p for p, _ in list_of_coefficients}
+        for prime in list_of_primes:
+            if prime not in present:
+                list_of_coefficients.append((prime, 0))
+    return coefficients
+
+
+def partial_crt(mods, prod_of_mods, rems, chooser):
+    inside_rems = [chooser(ir) for ir in rems]
+    if all(ir == 0 for ir in inside_rems):
+        return 0
+    temp = CRT(inside_rems, mods) % prod_of_mods
+    is_negative = temp < 0
+    temp = abs(temp)
+    t1 = prod_of_mods - temp
+    if t1 < temp:
+        temp = -t1
+    if is_negative:
+        temp *= -1
+    return temp
+
+
+def my_crt(input_dictionary):
+    """
+    This function is the reference implementation of Chinese Reminder Theorem (one monomial at a time).
+    For every monomial we have list of tuples (p_i, c_i) which satisfy the following system of congruences:
+    x = c_1 mod p_1
+    x = c_2 mod p_2
+    ...
+    x = c_k mod p_k
+    Chinese Reminder Theorem gives number c such that x = c mod (p_1p_2...p_k).
+    :param input_dictionary: Dictionary in form { (i, a) => [(p_1, c_1), (p_2, c_2), ..., (p_k, c_k)] }
+    :return: Dictionary in form { (i, a) => c }
+    """
+    result = {}
+    for k, p in input_dictionary.items():
+        mods = [t[0] for t in p]
+        rems = [t[1] for t in p]
+        prod_of_mods = reduce(lambda x, y: x*y, mods)
+        temp1 = partial_crt(mods, prod_of_mods, rems, imag)
+        temp2 = partial_crt(mods, prod_of_mods, rems, real)
+        if temp1 == 0:
+            result[k] = ZZ(temp2)
+        else:
+            result[k] = GaussianIntegers()(temp1*I + temp2)
+    return result
+
+
+def benchmark_crt(number_of_keys=20000, primes=(530560271, 530560211, 530560207, 530560183), is_imaginary=True):
+    """
+    This function compares function my_crt with function batched_crt for random remainders
+    :param number_of_keys: number of monomials
+    :param primes: list of prime numbers
+    :param is_imaginary: flag if remainders should have imaginary part
+    :return: dictionary with durations
+    """
+    zz = GaussianIntegers() if is_imaginary else ZZ
+    input_dictionary = {}
+    for key in range(number_of_keys):
+        input_dictionary[key] = []
+        for p in primes:
+            # some coefficients vanish modulo p
+            if randint(0, 9) == 0:
+                continue
+            if is_imaginary:
+                input_dictionary[key].append((p, zz([randint(0, p-1), randint(0, p-1)])))
+            else:
+                input_dictionary[key].append((p, zz(randint(0, p-1))))
+
+    start = time()
+    expected = batched_crt(input_dictionary, list(primes))
+    batched_duration = time() - start
+
+    start = time()
+    result = my_crt(fill_gaps({k: list(v) for k, v in input_dictionary.items()}, primes))
+    duration = time() - start
+
+    assert result == expected, "batched_crt gives different result than my_crt"
+    return {
+        'benchmark': 'crt',
+        'keys': number_of_keys,
+        'primes': len(primes),
+        'my_crt_duration': round(duration, DURATION_DIGITS),
+        'batched_crt_duration': round(batched_duration, DURATION_DIGITS)
+    }
+
+
+def benchmark_dense(names=("H1", "H2", "H3", "H4", "H5", "H6", "H7", "H8", "EX17"), memory_limit=256):
+    """
+    This function compares default implementation of ABCH algorithm (Sage polynomials) with the dense one
+    for mappings (after Segre homotopy) reduced modulo the first prime.
+    Mappings which are too big for dense representation are inverted by Sage only.
+    :param names: names of mappings
+    :param memory_limit: how much memory (in MB) can be utilized by dense representation
+    :return: list of dictionaries with durations
+    """
+    results = []
+    for name in names:
+        segre_mapping = mappings[name].segre_homotopy()
+        mapping = segre_mapping.reduce_mapping(segre_mapping.primes[0])
+        start = time()
+        expected = algorithm_abch.algorithm(mapping=mapping, debug=False, method='', dense_memory=0)
+        sage_duration = time() - start
+        result = {'benchmark': 'dense', 'mapping': mapping.name, 'sage_duration': round(sage_duration, DURATION_DIGITS)}
+        if is_dense_applicable(mapping, memory_limit):
+            start = time()
+            g = algorithm_abch.algorithm(mapping=mapping, debug=False, method='dense')
+            result['dense_duration'] = round(time() - start, DURATION_DIGITS)
+            assert g.F == expected.F, f"dense implementation gives different result for {name}"
+        results.append(result)
+    return results
+
+
+def benchmark_sparse(names=("H1", "H2", "H3", "H4", "H5", "H6", "H7", "H8"), prime=1000003):
+    """
+    This function compares default implementation of ABCH algorithm (Sage polynomials) with the sparse one
+    (packed exponents) for mappings (after Segre homotopy) reduced modulo given prime
+    :param names: names of mappings
+    :param prime: prime number, for small primes reduced mappings of H1-H8 are almost trivial
+    :return: list of dictionaries with durations
+    """
+    results = []
+    for name in names:
+        mapping = mappings[name].segre_homotopy().reduce_mapping(prime)
+        start = time()
+        expected = algorithm_abch.algorithm(mapping=mapping, debug=False, method='', dense_memory=0)
+        sage_duration = time() - start
+        start = time()
+        g = algorithm_abch.algorithm(mapping=mapping, debug=False, method='sparse')
+        sparse_duration = time() - start
+        assert g.F == expected.F, f"sparse implementation gives different result for {name}"
+        results.append({
+            'benchmark': 'sparse',
+            'mapping': mapping.name,
+            'sage_duration': round(sage_duration, DURATION_DIGITS),
+            'sparse_duration': round(sparse_duration, DURATION_DIGITS)
+        })
+    return results
+
+
+def benchmark_mapping_file(number_of_terms=100000, number_of_variables=10, max_exponent=6):
+    """
+    This function compares parsing of random mapping (method Mapping.parse) with saving it into mapping file
+    and loading it (only memory-mapped arrays by function load_compact or the whole mapping by function load_mapping)
+    :param number_of_terms: number of terms of the first coordinate (other coordinates are variables)
+    :param number_of_variables: number of variables
+    :param max_exponent: maximal exponent of every variable
+    :return: dictionary with durations
+    """
+    ring = PolynomialRing(QQ, [f"X{i+1}" for i in range(number_of_variables)])
+    terms = {}
+    while len(terms) < number_of_terms:
+        monomial = tuple(randint(0, max_exponent) for _ in range(number_of_variables))
+        terms[monomial] = QQ(randint(-1000, 1000)) / randint(1, 30)
+    mapping = Mapping([ring(terms)] + list(ring.gens()[1:]), "RANDOM", [], 1, False)
+    definitions = [str(f) for f in mapping.F]
+
+    start = time()
+    parsed = Mapping.parse(definitions, name="RANDOM")
+    parse_duration = time() - start
+    with TemporaryDirectory() as directory:
+        path = os.path.join(directory, "random.map")
+        start = time()
+        save_mapping(path, mapping)
+        save_duration = time() - start
+        start = time()
+        load_compact(path)
+        load_compact_duration = time() - start
+        start = time()
+        loaded = load_mapping(path)
+        load_duration = time() - start
+        size = os.path.getsize(path)
+    assert parsed.F == mapping.F and loaded.F == mapping.F, "parsed or loaded mapping is different"
+    return {
+        'benchmark': 'mapping_file',
+        'terms': number_of_terms,
+        'file_size': size,
+        'parse_duration': round(parse_duration, DURATION_DIGITS),
+        'save_duration': round(save_duration, DURATION_DIGITS),
+        'load_compact_duration': round(load_compact_duration, DURATION_DIGITS),
+        'load_mapping_duration': round(load_duration, DURATION_DIGITS)
+    }
+
+
+STARTUP_SCRIPT = """
+import json
+from time import time
+start = time()
+from sage.all import *
+sage_import = time() - start
+start = time()
+from mappings import mappings
+from mapping import Mapping
+from mapping_file import save_mapping, load_compact, load_mapping
+mappings_import = time() - start
+names = list(mappings)
+start = time()
+mappings[names[0]]
+first_access = time() - start
+start = time()
+for name in names:
+    mappings[name]
+all_mappings = time() - start
+print(json.dumps([sage_import, mappings_import, first_access, all_mappings]))
+"""
+
+
+def benchmark_startup():
+    """
+    This function measures (in fresh processes) time of importing Sage and the registry of mappings,
+    time of building the first mapping and all the mappings and duration of command "main.py --help"
+    :return: dictionary with durations
+    """
+    output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT], capture_output=True, text=True, check=True)
+    sage_import, mappings_import, first_access, all_mappings = json.loads(output.stdout.splitlines()[-1])
+    start = time()
+    subprocess.run([sys.executable, "main.py", "--help"], capture_output=True, check=True)
+    help_duration = time() - start
+    return {
+        'benchmark': 'startup',
+        'sage_import_duration': round(sage_import, DURATION_DIGITS),
+        'mappings_import_duration': round(mappings_import, DURATION_DIGITS),
+        'first_mapping_duration': round(first_access, DURATION_DIGITS),
+        'all_mappings_duration': round(all_mappings, DURATION_DIGITS),
+        'help_duration': round(help_duration, DURATION_DIGITS)
+    }
+
+
+benchmarks = {
+    "crt": benchmark_crt,
+    "dense": benchmark_dense,
+    "mapping_file": benchmark_mapping_file,
+    "sparse": benchmark_sparse,
+    "startup": benchmark_startup
+}
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(
+            prog="sage benchmark.py",
+            formatter_class=RawDescriptionHelpFormatter,
+            epilog=textwrap.dedent('''
+            This is application to compare alternative implementations of parts of our program.
+
+            For details see file README.md.
+            '''))
+    parser.add_argument(
+            "benchmark",
+            metavar="BENCHMARK",
+            nargs='*',
+            type=str,
+            help="Choose benchmarks to run, by default all benchmarks are executed",
+            choices=list(benchmarks.keys()) + [[]],
+            default=[]
+    )
+    args = parser.parse_args()
+    for name in args.benchmark or benchmarks.keys():
+        print(benchmarks[name]())
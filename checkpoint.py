@@ -0,0 +1,87 @@
+"""
+This file contains storage of checkpoints, which let long computations be continued after interruption
+(e.g. timeout or memory limit). Every checkpoint is a pickle file named by its key.
+See details in README.md file.
+"""
+import os
+import pickle
+from time import time
+
+
+# default minimal time (in seconds) between two checkpoints with the same key
+CHECKPOINT_INTERVAL = 60
+# extension of files with checkpoints
+EXTENSION = '.checkpoint'
+
+
+class Checkpoints:
+    """
+    Class storing checkpoints in a directory. Checkpoints are saved at most once per interval
+    (unless saving is forced) and they are loaded only when resuming is enabled.
+    """
+
+    def __init__(self, directory, interval=CHECKPOINT_INTERVAL, resume=False):
+        """
+        :param directory: directory with checkpoints
+        :param interval: minimal time (in seconds) between two checkpoints with the same key
+        :param resume: flag if saved checkpoints should be loaded
+        """
+        self.directory = directory
+        self.interval = interval
+        self.resume = resume
+        self.last_saved = {}
+
+    def __repr__(self):
+        return f'Checkpoints({self.directory!r}, {self.interval}, {self.resume})'
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + EXTENSION)
+
+    def load(self, key):
+        """
+        This method loads saved state
+        :param key: key of the checkpoint
+        :return: saved state or None if there is no checkpoint (or resuming is disabled)
+        """
+        self.last_saved.setdefault(key, time())
+        if not self.resume:
+            return None
+        try:
+            with open(self._path(key), 'rb') as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, pickle.UnpicklingError):
+            # broken checkpoint is ignored, computations start from the beginning
+            return None
+
+    def save(self, key, state, force=False):
+        """
+        This method saves state if the interval elapsed since the last checkpoint with the same key
+        :param key: key of the checkpoint
+        :param state: picklable object
+        :param force: flag if state should be saved regardless of the interval
+        :return: True if state was saved
+        """
+        now = time()
+        if not force and now - self.last_saved.setdefault(key, now) < self.interval:
+            return False
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        temporary_path = f'{path}.{os.getpid()}'
+        with open(temporary_path, 'wb') as f:
+            pickle.dump(state, f)
+        os.replace(temporary_path, path)
+        self.last_saved[key] = time()
+        return True
+
+    def remove(self, key):
+        """
+        This method removes checkpoint which is no longer needed
+        :param key: key of the checkpoint
+        """
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+        self.last_saved.pop(key, None)
@@ -2,32 +2,193 @@
 This file contains functions which are necessary to use Chinese Reminder Theorem
 """
 from sage.all import *
+import numpy
 from mapping import Mapping
 
 
-def map2dict(mapping, is_imaginary, p=None):
+# the biggest primes for which reduced mappings are handled by Singular:
+# GF(p) is supported for p < 2^31, residue fields of Gaussian integers GF(p^2) for p < 2^29
+PRIME_BOUND = 2**31
+GAUSSIAN_PRIME_BOUND = 2**29
+# rational reconstruction fails unless the maximal quotient is bigger than 2^RECONSTRUCTION_BITS * log2(M),
+# it makes probability of returning wrong fraction negligible
+RECONSTRUCTION_BITS = 10
+# initial size of CoefficientStore, it grows twice when needed
+STORE_ROWS = 1024
+STORE_COLUMNS = 8
+
+
+def prime_generator(is_imaginary, bound=None):
     """
-    This function converts polynomial mapping F (defined as list of n polynomials) into dictionary.
-    The keys in this dictionary are tuples (i, a) where
-    - i is the index of polynomial F_i in list F
-    - a is a list of exponents in monomial
-    The value for specified key is a list consisting of coefficient
-    in F_i standing next to monomial defined by exponents.
-    If the mapping F is defined over finite field the value is a list consisting
-    of tuple of coefficient and prime number p
-    :param mapping: Polynomial mapping defined over ring R
+    This function generates prime numbers for reductions, starting from the biggest primes
+    which fit into machine word (so CRT needs less of them).
+    For mappings with imaginary part only primes p = 3 mod 4 are generated,
+    because then p is a prime in Gaussian integers.
+    :param is_imaginary: flag if mapping is defined over field with imaginary part
+    :param bound: all generated primes are smaller than bound, if None the default one is used
+    :return: generator of prime numbers
+    """
+    if bound is None:
+        bound = GAUSSIAN_PRIME_BOUND if is_imaginary else PRIME_BOUND
+    p = bound
+    while p > 3:
+        p = previous_prime(p)
+        if not is_imaginary or p % 4 == 3:
+            yield p
+
+
+def map2rows(mapping, is_imaginary):
+    """
+    This function converts polynomial mapping F defined over finite field into compact list of rows,
+    which can be cheaply sent between processes and inserted into CoefficientStore.
+    :param mapping: Polynomial mapping defined over GF(p) or GF(p^2)
     :param is_imaginary: flag if input mapping is defined over field with imaginary part
-    :param p: prime number
-    :return: Dictionary { (i, a) => [coefficient] } or dictionary { (i, a) => [(coefficient, p)] }
+    :return: list of tuples ((i, a), real part, imaginary part) where i is the index of polynomial F_i
+             and a is a tuple of exponents in monomial
     """
+    rows = []
     if is_imaginary:
         zz = GaussianIntegers()
+        for index, f in enumerate(mapping):
+            for m, c in f.dict().items():
+                c = zz(c)
+                rows.append(((index, tuple(m)), int(real(c)), int(imag(c))))
     else:
-        zz = ZZ
-    if p is None:
-        return {(index, m): [zz(c)] for index, f in enumerate(mapping) for m, c in f.dict().items()}
-    else:
-        return {(index, m): [(p, zz(c))] for index, f in enumerate(mapping) for m, c in f.dict().items()}
+        for index, f in enumerate(mapping):
+            for m, c in f.dict().items():
+                rows.append(((index, tuple(m)), int(ZZ(c)), 0))
+    return rows
+
+
+class CoefficientStore:
+    """
+    Class storing remainders of coefficients of inverse mappings modulo many prime numbers.
+    Monomials are interned to row indices and remainders are kept in array of shape
+    (parts, monomials, primes), where parts are real and (for imaginary mappings) imaginary parts.
+    Columns are filled in place when inversion for the next prime is computed,
+    zeros mean that coefficient vanishes modulo the prime.
+    """
+
+    def __init__(self, is_imaginary, rows=STORE_ROWS, columns=STORE_COLUMNS):
+        """
+        :param is_imaginary: flag if remainders have imaginary part
+        :param rows: initial number of rows
+        :param columns: initial number of columns
+        """
+        self.imaginary = is_imaginary
+        self.keys = []
+        self.index = {}
+        self.primes = []
+        self.residues = numpy.zeros((2 if is_imaginary else 1, rows, columns), dtype=numpy.int64)
+
+    def _resize(self, rows, columns, dtype):
+        parts, old_rows, old_columns = self.residues.shape
+        residues = numpy.zeros((parts, rows, columns), dtype=dtype)
+        residues[:, :old_rows, :old_columns] = self.residues
+        self.residues = residues
+
+    def _column(self, p):
+        if p in self.primes:
+            return self.primes.index(p)
+        _, rows, columns = self.residues.shape
+        # remainders modulo primes which don't fit into machine word need arbitrary precision integers
+        dtype = self.residues.dtype if p < 2**63 else object
+        if len(self.primes) == columns or dtype != self.residues.dtype:
+            self._resize(rows, max(2*columns, 1), dtype)
+        self.primes.append(p)
+        return len(self.primes) - 1
+
+    def _row(self, key):
+        row = self.index.get(key)
+        if row is None:
+            row = len(self.keys)
+            self.index[key] = row
+            self.keys.append(key)
+            _, rows, columns = self.residues.shape
+            if row == rows:
+                self._resize(max(2*rows, 1), columns, self.residues.dtype)
+        return row
+
+    def add(self, p, rows):
+        """
+        This method stores remainders of coefficients modulo prime number p
+        :param p: prime number
+        :param rows: list of tuples (key, real part, imaginary part), see function map2rows
+        """
+        p = int(p)
+        column = self._column(p)
+        indices = [self._row(key) for key, _, _ in rows]
+        self.residues[0, indices, column] = [x % p for _, x, _ in rows]
+        if self.imaginary:
+            self.residues[1, indices, column] = [y % p for _, _, y in rows]
+
+    def crt(self, rational=False):
+        """
+        This method uses Chinese Reminder Theorem to obtain coefficients from stored remainders:
+        for every monomial the coefficient c is the symmetric remainder modulo p_1p_2...p_k
+        such that c = c_i mod p_i for every stored prime p_i. Garner algorithm is performed on whole columns at once.
+        :param rational: flag if coefficients should be retrieved using rational reconstruction
+        :return: Dictionary in form { (i, a) => c }
+        """
+        n = len(self.keys)
+        if n == 0:
+            return {}
+        # real parts are in rows 0..n-1, imaginary parts in rows n..2n-1
+        columns = [self.residues[:, :n, j].reshape(-1) for j in range(len(self.primes))]
+        values = garner(columns, self.primes, garner_basis(self.primes))
+        prod_of_mods = reduce(lambda x, y: x*y, [ZZ(p) for p in self.primes])
+        # constructing Gaussian integers from a list of coordinates is slow, generators are used instead
+        gaussian_one, gaussian_i = GaussianIntegers().gens()
+        gaussian_fraction_one, gaussian_fraction_i = gaussian_one / 1, gaussian_i / 1
+        result = {}
+        for row, k in enumerate(self.keys):
+            temp2 = ZZ(values[row])
+            temp1 = ZZ(values[row + n]) if self.imaginary else ZZ(0)
+            if rational:
+                temp2 = rational_reconstruction_mq(temp2, prod_of_mods)
+                temp1 = rational_reconstruction_mq(temp1, prod_of_mods)
+                if temp1 is None or temp2 is None:
+                    raise ValueError(f'Rational reconstruction failed for monomial {k}')
+                if temp1 == 0:
+                    result[k] = QQ(temp2)
+                else:
+                    result[k] = temp2 * gaussian_fraction_one + temp1 * gaussian_fraction_i
+            elif temp1 == 0:
+                result[k] = ZZ(temp2)
+            else:
+                result[k] = temp2 * gaussian_one + temp1 * gaussian_i
+        return result
+
+    def save(self, path):
+        """
+        This method writes the store into compressed .npz file, so computations can be resumed.
+        Keys have to be of the form (i, a) as produced by function map2rows.
+        :param path: path to the file
+        """
+        n, k = len(self.keys), len(self.primes)
+        keys = numpy.array([(i,) + tuple(a) for i, a in self.keys], dtype=numpy.int64)
+        numpy.savez_compressed(
+                path,
+                imaginary=numpy.array(self.imaginary),
+                keys=keys.reshape(n, -1) if n > 0 else numpy.zeros((0, 0), dtype=numpy.int64),
+                primes=numpy.array(self.primes, dtype=self.residues.dtype),
+                residues=self.residues[:, :n, :k])
+
+    @staticmethod
+    def load(path):
+        """
+        This method reads the store written by method save
+        :param path: path to the file
+        :return: CoefficientStore
+        """
+        with numpy.load(path, allow_pickle=True) as data:
+            residues = data['residues']
+            store = CoefficientStore(bool(data['imaginary']), *residues.shape[1:])
+            store.residues = residues
+            store.primes = [int(p) for p in data['primes']]
+            store.keys = [(int(key[0]), tuple(int(a) for a in key[1:])) for key in data['keys']]
+            store.index = {key: row for row, key in enumerate(store.keys)}
+        return store
 
 
 def dict2map(input_dictionary, mapping):
@@ -41,81 +202,104 @@ def dict2map(input_dictionary, mapping):
     for index, k in input_dictionary:
         x = input_dictionary[(index, k)]
         f[index] += mapping.R({k: x})
-    return Mapping(f, mapping.name+"^{-1}", mapping.R, [], 1, mapping.imaginary)
+    return Mapping(f, mapping.name+"^{-1}", [], 1, mapping.imaginary, mapping.R)
 
 
-def is_there_prime(list_of_coefficients, prime):
-    for p, c in list_of_coefficients:
-        if p == prime:
-            return True
-    return False
+def garner_basis(primes):
+    """
+    Function precomputes constants used by Garner algorithm for given prime numbers:
+    inverses of p_1*...*p_(k-1) modulo p_k
+    :param primes: list of prime numbers [p_1, ..., p_k]
+    :return: list of inverses (the first one is equal to 1)
+    """
+    inverses = [1]
+    for k in range(1, len(primes)):
+        prod_of_mods = reduce(lambda x, y: x*y, primes[:k])
+        inverses.append(int(inverse_mod(prod_of_mods % primes[k], primes[k])))
+    return inverses
 
 
-def fill_gaps(coefficients, list_of_primes):
-    for t in coefficients:
-        list_of_coefficients = coefficients[t]
-        for prime in list_of_primes:
-            if not is_there_prime(list_of_coefficients, prime):
-                list_of_coefficients.append((prime, 0))
-    return coefficients
+def garner(columns, primes, inverses):
+    """
+    Function uses Garner algorithm to solve systems of congruences x = c_j mod p_j for many x at once.
+    All operations on mixed radix digits are performed on arrays, so they are vectorized.
+    :param columns: list of arrays, j-th array contains remainders modulo p_j
+    :param primes: list of prime numbers [p_1, ..., p_k]
+    :param inverses: constants computed by function garner_basis
+    :return: array of integers x (in symmetric range) such that x = c_j mod p_j
+    """
+    primes = [int(p) for p in primes]
+    # fixed size integers can be used if products of two remainders fit into 64 bits
+    dtype = numpy.int64 if max(primes) < 2**31 else object
+    digits = []
+    for k, (column, p) in enumerate(zip(columns, primes)):
+        column = numpy.asarray(column, dtype=dtype) % p
+        if k == 0:
+            digits.append(column)
+            continue
+        # value of x modulo p_k known from previous digits (Horner scheme)
+        partial = digits[k-1] % p
+        for j in range(k-2, -1, -1):
+            partial = (partial * (primes[j] % p) + digits[j]) % p
+        digits.append(((column - partial) % p) * inverses[k] % p)
+    result = numpy.zeros(len(columns[0]), dtype=object)
+    for k in range(len(primes) - 1, -1, -1):
+        result = result * primes[k] + digits[k].astype(object)
+    prod_of_mods = reduce(lambda x, y: x*y, primes)
+    return numpy.where(2*result > prod_of_mods, result - prod_of_mods, result)
 
 
-def dicts_union(a, b):
+def batched_crt(input_dictionary, primes, rational=False):
     """
-    Function calculates some kind of sum of two dictionaries
-    :param a: Dictionary in form { (i, a) => [(coefficient_A, p_A)] }
-    :param b: Dictionary in form { (i, a) => [(coefficient_B, p_b)] }
-    :return: Dictionary in form { (i, a) => [(coefficient_A, p_A), (coefficient_B, p_B)] }
+    Function uses Chinese Reminder Theorem to obtain the result (see method CoefficientStore.crt).
+    Remainders are moved into CoefficientStore, so constants for the set of primes are computed once
+    and all monomials are processed at once.
+    :param input_dictionary: Dictionary in form { (i, a) => [(p_1, c_1), (p_2, c_2), ..., (p_k, c_k)] },
+                             missing primes mean that coefficient is equal to 0
+    :param primes: list of prime numbers [p_1, ..., p_k]
+    :param rational: flag if coefficients should be retrieved using rational reconstruction
+    :return: Dictionary in form { (i, a) => c }
     """
-    result = {k: [] for k in a.keys() | b.keys()}
-    for k in a:
-        result[k] += a[k]
-    for k in b:
-        result[k] += b[k]
-    return result
+    rows = {p: [] for p in primes}
+    for k, coefficients in input_dictionary.items():
+        for p, c in coefficients:
+            rows[p].append((k, int(real(c)), int(imag(c))))
+    store = CoefficientStore(True, len(input_dictionary), len(primes))
+    # monomials without remainders are equal to 0 modulo all primes, but they are still in the result
+    for k in input_dictionary:
+        store._row(k)
+    for p in primes:
+        store.add(p, rows[p])
+    return store.crt(rational)
 
 
-def my_crt(input_dictionary):
+def rational_reconstruction_mq(u, m):
     """
-    Function uses Chinese Reminder Theorem to obtain the result.
-    For every monomial we have list of tuples (c_i, p_i) which satisfy the following system of congruences:
-    x = c_1 mod p_1
-    x = c_2 mod p_2
-    ...
-    x = c_k mod p_k
-    Chinese Reminder Theorem gives number c such that x = c mod (p_1p_2...p_k).
-    It is our candidate for coefficient standing next to monomial a in polynomial F_i
-    :param input_dictionary: Dictionary in form { (i, a) => [(c_1, p_1), (c_2, p_2), ..., (c_k, p_k)] }
-    :return: Dictionary in form { (i, a) => c }
+    Function finds fraction n/d such that n = u*d mod m using maximal quotient rational reconstruction
+    (M. Monagan, Maximal quotient rational reconstruction: an almost optimal algorithm for rational reconstruction).
+    The fraction is returned only if the maximal quotient in Euclidean algorithm is big enough.
+    :param u: remainder
+    :param m: modulus
+    :return: fraction n/d or None if reconstruction failed
     """
-    result = {}
-
-    for k, p in input_dictionary.items():
-        mods = [t[0] for t in p]
-        rems = [t[1] for t in p]
-        prod_of_mods = reduce(lambda x, y: x*y, mods)
-
-        temp1 = partial_crt(mods, prod_of_mods, rems, imag)
-        temp2 = partial_crt(mods, prod_of_mods, rems, real)
-
-        if temp1 == 0:
-            temp = ZZ(temp2)
-        else:
-            temp = GaussianIntegers()(temp1*I + temp2)
-        result[k] = temp
-    return result
-
-
-def partial_crt(mods, prod_of_mods, rems, chooser):
-    inside_rems = [chooser(ir) for ir in rems]
-    if all(ir == 0 for ir in inside_rems):
-        return 0
-    temp = CRT(inside_rems, mods) % prod_of_mods
-    is_negative = temp < 0
-    temp = abs(temp)
-    t1 = prod_of_mods - temp
-    if t1 < temp:
-        temp = -t1
-    if is_negative:
-        temp *= -1
-    return temp
+    u = ZZ(u) % m
+    if u == 0:
+        return QQ(0)
+    threshold = 2**RECONSTRUCTION_BITS * ZZ(m).nbits()
+    r0, r1 = ZZ(m), u
+    t0, t1 = ZZ(0), ZZ(1)
+    best = None
+    max_quotient = 0
+    while r1 != 0:
+        q = r0 // r1
+        if q > max_quotient:
+            max_quotient = q
+            best = (r1, t1)
+        r0, r1 = r1, r0 - q*r1
+        t0, t1 = t1, t0 - q*t1
+    if best is None or max_quotient <= threshold:
+        return None
+    n, d = best
+    if gcd(n, d) != 1:
+        return None
+    return QQ(n) / QQ(d)
@@ -0,0 +1,292 @@
+"""
+This file contains implementation of ABCH algorithm for mappings defined over prime fields GF(p),
+in which truncated polynomials are stored as dense NumPy arrays of coefficients.
+Monomials of degree at most degree limit are numbered in graded order (monomial rank),
+so truncation to lower degree is just a prefix of the array. Arrays are only as long as needed
+for the degree of the polynomial.
+See details in README.md file.
+"""
+from sage.all import *
+import sys
+from time import time
+import numpy
+from tracer import StepTimer, phase, TIME_DIGITS
+
+
+# default memory limit (in MB) for dense representation chosen automatically by the default method of ABCH,
+# 0 disables automatic choice: inverses of reduced mappings we study are sparse,
+# so Sage polynomials are faster for them (see benchmark 'dense' in benchmark.py)
+DENSE_MEMORY = 0
+
+
+def graded_exponents(n, degree_limit):
+    """
+    This function lists exponents of all monomials in n variables of degree at most degree_limit
+    in graded order (monomials of the same degree are ordered lexicographically, starting from X_1^k)
+    :param n: number of variables
+    :param degree_limit: boundary for degree
+    :return: tuple (array of exponents of shape (monomials, n), list of numbers of monomials of degree at most k)
+    """
+    # homogeneous[k] contains exponents of monomials of degree k in the last variables
+    homogeneous = [numpy.array([[k]], dtype=numpy.int64) for k in range(degree_limit + 1)]
+    for _ in range(n - 1):
+        homogeneous = [numpy.concatenate([
+                numpy.hstack([numpy.full((len(homogeneous[k - e]), 1), e, dtype=numpy.int64), homogeneous[k - e]])
+                for e in range(k, -1, -1)]) for k in range(degree_limit + 1)]
+    counts = list(numpy.cumsum([len(h) for h in homogeneous]))
+    return numpy.concatenate(homogeneous), [int(c) for c in counts]
+
+
+def dense_size(mapping, degree_limit):
+    """
+    This function estimates memory (in bytes) needed by DenseEngine
+    :param mapping: object defining mapping to inverse
+    :param degree_limit: boundary for degree
+    :return: number of bytes
+    """
+    monomials = binomial(mapping.n + degree_limit, mapping.n)
+    terms = sum(f.number_of_terms() for f in mapping.F)
+    # exponents, keys, shift table per term of F and a few working arrays
+    return 8 * monomials * (mapping.n + terms + 8)
+
+
+def is_dense_applicable(mapping, memory_limit=DENSE_MEMORY):
+    """
+    This function checks if mapping can be inverted by DenseEngine
+    :param mapping: object defining mapping to inverse
+    :param memory_limit: how much memory (in MB) can be utilized by dense representation, if None it isn't checked
+    :return: True if mapping is defined over prime field and its dense representation fits the limit
+    """
+    field = mapping.R.base_ring()
+    if not field.is_finite() or not field.is_prime_field() or field.characteristic() >= 2**31:
+        return False
+    degree_limit = mapping.degree_limit()
+    # identity mapping (D = -1) doesn't need any computations
+    if degree_limit < 1 or (degree_limit + 1) ** mapping.n >= 2**63:
+        return False
+    return memory_limit is None or dense_size(mapping, degree_limit) <= memory_limit * 2**20
+
+
+class DenseEngine:
+    """
+    Class performing ABCH algorithm on dense arrays of coefficients modulo prime number.
+    Multiplication by F_i is a sum of shifted copies of the array (one shift table per term of F_i),
+    substitution p(F) is computed using Horner scheme.
+    """
+
+    def __init__(self, mapping):
+        """
+        :param mapping: object defining mapping to inverse, it has to be defined over GF(p) for p < 2^31
+        """
+        self.mapping = mapping
+        self.n = mapping.n
+        self.q = int(mapping.R.base_ring().characteristic())
+        self.degree_limit = mapping.degree_limit()
+        self.exponents, self.counts = graded_exponents(self.n, self.degree_limit)
+        self.degrees = self.exponents.sum(axis=1)
+        # monomials are identified by their exponents written in base degree_limit + 1
+        self.radix = (self.degree_limit + 1) ** numpy.arange(self.n, dtype=numpy.int64)
+        self.keys = self.exponents @ self.radix
+        self.order = numpy.argsort(self.keys)
+        self.sorted_keys = self.keys[self.order]
+        self.terms = [[(self._shift_table(m), sum(m), int(ZZ(c)) % self.q) for m, c in f.dict().items()]
+                      for f in mapping.F]
+        self.degrees_of_f = [max(degree for _, degree, _ in terms) if terms else 0 for terms in self.terms]
+
+    def _count(self, degree_limit):
+        """
+        This method returns number of monomials of degree at most degree_limit
+        """
+        return self.counts[min(degree_limit, self.degree_limit)] if degree_limit >= 0 else 0
+
+    def _degree(self, a):
+        """
+        This method returns boundary for degree of truncated polynomial stored in array
+        (arrays always contain all monomials of degree at most the boundary)
+        """
+        return self.counts.index(len(a))
+
+    def _shift_table(self, exponents):
+        """
+        This method computes ranks of monomials X^a * X^exponents for all monomials X^a
+        with degree at most degree_limit - |exponents|
+        :param exponents: list of exponents in monomial
+        :return: array of ranks
+        """
+        sources = self._count(self.degree_limit - sum(exponents))
+        targets = self.keys[:sources] + int(numpy.dot(exponents, self.radix))
+        return self.order[numpy.searchsorted(self.sorted_keys, targets)]
+
+    def zero(self):
+        """
+        This method returns array representing zero polynomial
+        """
+        return numpy.zeros(1, dtype=numpy.int64)
+
+    def add(self, a, b):
+        """
+        This method adds two truncated polynomials
+        :param a: array of coefficients
+        :param b: array of coefficients
+        :return: array of coefficients of a + b
+        """
+        if len(a) < len(b):
+            a, b = b, a
+        result = a.copy()
+        result[:len(b)] = (result[:len(b)] + b) % self.q
+        return result
+
+    def trim(self, a):
+        """
+        This method shortens array to the degree of polynomial
+        :param a: array of coefficients
+        :return: the shortest array representing the same polynomial
+        """
+        ranks = numpy.nonzero(a)[0]
+        if len(ranks) == 0:
+            return self.zero()
+        return a[:self._count(int(self.degrees[ranks[-1]]))]
+
+    def from_polynomial(self, p):
+        """
+        This method converts polynomial into dense array, terms of degree higher than degree limit are skipped
+        :param p: n-variable polynomial
+        :return: array of coefficients
+        """
+        result = numpy.zeros(self.counts[-1], dtype=numpy.int64)
+        for m, c in p.dict().items():
+            if sum(m) <= self.degree_limit:
+                key = int(numpy.dot(m, self.radix))
+                result[self.order[numpy.searchsorted(self.sorted_keys, key)]] = int(ZZ(c)) % self.q
+        return self.trim(result)
+
+    def to_polynomial(self, a):
+        """
+        This method converts dense array into polynomial
+        :param a: array of coefficients
+        :return: n-variable polynomial
+        """
+        ranks = numpy.nonzero(a)[0]
+        return self.mapping.R({tuple(int(e) for e in self.exponents[r]): int(a[r]) for r in ranks})
+
+    def multiply(self, a, index, degree_limit):
+        """
+        This method multiplies truncated polynomial by F_index
+        :param a: array of coefficients
+        :param index: index of polynomial F_index
+        :param degree_limit: boundary for degree
+        :return: array of coefficients of monomials of degree at most degree_limit
+        """
+        degree = self._degree(a)
+        result = numpy.zeros(self._count(min(degree_limit, degree + self.degrees_of_f[index])), dtype=numpy.int64)
+        for shift, term_degree, c in self.terms[index]:
+            sources = self._count(min(degree_limit - term_degree, degree))
+            if sources == 0:
+                continue
+            targets = shift[:sources]
+            result[targets] = (result[targets] + c * a[:sources]) % self.q
+        return result
+
+    def _compose(self, a, ranks, index, degree_limit):
+        """
+        This method calculates truncated value of polynomial given by terms with given ranks
+        for arguments F_1, ..., F_n. Horner scheme is used with respect to variable with given index,
+        the remaining variables are handled recursively.
+        :param a: array of coefficients of polynomial
+        :param ranks: array of ranks of terms, exponents of variables before index are ignored
+        :param index: index of the variable
+        :param degree_limit: boundary for degree
+        :return: array of coefficients of monomials of degree at most degree_limit
+        """
+        if index == self.n:
+            return numpy.array([a[ranks].sum() % self.q], dtype=numpy.int64)
+        exponents = self.exponents[ranks, index]
+        result = self.zero()
+        for k in range(int(exponents.max()), -1, -1):
+            # result will be multiplied by F_index^k, so terms above degree_limit - k are not needed
+            if k < int(exponents.max()):
+                result = self.multiply(result, index, degree_limit - k)
+            group = ranks[exponents == k]
+            if len(group) > 0:
+                result = self.add(result, self._compose(a, group, index + 1, degree_limit - k))
+        return result
+
+    def compose(self, a):
+        """
+        This method calculates value of polynomial for arguments defined in mapping F
+        :param a: array of coefficients of polynomial
+        :return: array of coefficients of p(F) without terms of degree higher than degree limit
+        """
+        ranks = numpy.nonzero(a)[0]
+        if len(ranks) == 0:
+            return self.zero()
+        return self._compose(a, ranks, 0, self.degree_limit)
+
+    def inverse_coordinate(self, index, debug, tracer=None):
+        """
+        This method obtains an inverse of index-th coordinate of mapping F (see function inverse_algorithm)
+        :param index: index of coordinate to inverse
+        :param debug: flag if debug should be printed to standard output
+        :param tracer: Tracer recording every step, if None steps are not recorded
+        :return: G_index - index-th coordinate of global inverse mapping G
+        """
+        x = self.mapping.R.gens()[index]
+        if debug:
+            print('---------------------------------------------')
+            print(f'Executing algorithm for {x} (dense)')
+        _, _, lower_degrees = self.mapping.degrees()
+        if lower_degrees[index] == sys.maxsize:
+            if debug:
+                print('There is no need to perform the algorithm')
+            return x
+        steps_limit = self.mapping.steps_limit(index)
+        if debug:
+            print(f'Maximum number of steps: {steps_limit}')
+            print(f'Inversion degree boundary: {self.degree_limit}')
+        if tracer is not None:
+            start = time()
+            tracer.record('start', mapping=self.mapping.name, coordinate=index, steps_limit=steps_limit,
+                          degree_limit=self.degree_limit)
+        p = self.from_polynomial(x)
+        result = p.copy()
+        step = 1
+        while True:
+            timer = StepTimer() if tracer is not None else None
+            with phase(timer, 'substitution'):
+                image = self.compose(p)
+            with phase(timer, 'truncation'):
+                p = self.trim(self.add(p, (-image) % self.q))
+            result = self.add(result, p)
+            ranks = numpy.nonzero(p)[0]
+            if debug or tracer is not None:
+                degrees = self.degrees[ranks]
+            if tracer is not None:
+                tracer.record('step', mapping=self.mapping.name, coordinate=index, step=step, terms=len(ranks),
+                              degree=int(degrees.max()) if len(ranks) else None,
+                              ldegree=int(degrees.min()) if len(ranks) else None, **timer.summary())
+            if len(ranks) == 0:
+                if debug:
+                    print(f'P_{step} = 0')
+                reason = 'zero'
+                break
+            if debug:
+                print(f'P_{step} has degree: {degrees.max()}, ldegree: {degrees.min()}, length: {len(ranks)}')
+            if step == steps_limit:
+                if debug:
+                    print('NOT PASCAL FINITE!')
+                reason = 'steps_limit'
+                break
+            step += 1
+        if tracer is not None:
+            tracer.record('end', mapping=self.mapping.name, coordinate=index, reason=reason, steps=step,
+                          duration=round(time() - start, TIME_DIGITS))
+        return self.to_polynomial(result)
+
+    def inverse(self, debug, tracer=None):
+        """
+        This method obtains all coordinates of the inverse
+        :param debug: flag if debug should be printed to standard output
+        :param tracer: Tracer recording every step, if None steps are not recorded
+        :return: list [G_1, ..., G_n]
+        """
+        return [self.inverse_coordinate(index, debug, tracer) for index in range(self.n)]
@@ -2,10 +2,16 @@
 This file contains main program of this repository.
 """
 import textwrap
-from datetime import datetime
 from argparse import ArgumentParser, RawDescriptionHelpFormatter
 from mappings import mappings
-from algorithms import algorithms, maple_methods, sage_methods
+from mapping_file import load_mapping, save_compact
+from algorithms import algorithms, methods, maple_methods, reduced_sage_methods, verification_modes, VERIFY_PROBABILISTIC
+from probabilistic_check import ERROR_PROBABILITY
+from result_cache import ResultCache, RESULT_CACHE_SIZE
+from checkpoint import Checkpoints, CHECKPOINT_INTERVAL
+from tracer import Tracer
+from results_log import LOG_FILE, environment, now, write_record
+from memory import MIN_ADDRESS_SPACE_LIMIT
 
 if __name__ == '__main__':
 
@@ -26,16 +32,35 @@ if __name__ == '__main__':
             default=False
     )
     parser.add_argument(
-            "-v", "--verify", 
-            action="store_true",
-            help="Turn on verifying if result is inversion", 
-            default=False
+            "-v", "--verify",
+            metavar="MODE",
+            nargs='?',
+            type=str,
+            help="Turn on verifying if result is inversion: 'probabilistic' (default) evaluates G(F(a)) " +
+                 "at random points modulo random primes, 'exact' composes G(F) symbolically",
+            choices=verification_modes,
+            const=VERIFY_PROBABILISTIC,
+            default=None
+    )
+    parser.add_argument(
+            "--error-probability",
+            metavar="P",
+            nargs=1,
+            type=float,
+            help="Probability that wrong coordinate of the inverse (or wrong jacobian) passes probabilistic check, " +
+                 f"default value is {ERROR_PROBABILITY}",
+            default=None
     )
     parser.add_argument(
             "-j", "--jacobian",
-            action="store_true",
-            help="Turn on checking if jacobian is constant",
-            default=False
+            metavar="MODE",
+            nargs='?',
+            type=str,
+            help="Turn on checking if jacobian is constant (equal to 1): 'probabilistic' (default) computes " +
+                 "the determinant at random points modulo random primes, 'exact' confirms it symbolically",
+            choices=verification_modes,
+            const=VERIFY_PROBABILISTIC,
+            default=None
     )
     parser.add_argument(
             "-e", "--method",
@@ -43,7 +68,7 @@ if __name__ == '__main__':
             nargs=1,
             type=str,
             help="Choose Groebner basis method for maple, default value is ''",
-            choices=maple_methods + sage_methods,
+            choices=maple_methods + reduced_sage_methods,
             default='',
             required=False
     )
@@ -52,8 +77,8 @@ if __name__ == '__main__':
             metavar="FILE",
             nargs=1,
             type=str,
-            help="Log file",
-            default="log.out",
+            help=f"Log file (JSON lines), default value is {LOG_FILE}",
+            default=[LOG_FILE],
             required=False
     )
     parser.add_argument(
@@ -75,6 +100,150 @@ if __name__ == '__main__':
             default=None,
             required=False
     )
+    parser.add_argument(
+            "--log-coordinates",
+            action="store_true",
+            help="Log every coordinate of the inverse (with result of its verification) as soon as it is computed, " +
+                 "before the result of the whole run",
+            default=False
+    )
+    parser.add_argument(
+            "--save-inverse",
+            metavar="FILE",
+            nargs=1,
+            type=str,
+            help="Mapping file where the inverse is saved (only if it was computed and it passed verification " +
+                 "or it wasn't verified), default value is None - the inverse is not saved",
+            default=None,
+            required=False
+    )
+    parser.add_argument(
+            "--hard-memory-limit",
+            action="store_true",
+            help="Set memory limit (option -r) also as limit of virtual memory (RLIMIT_AS) of every process, " +
+                 "so allocations above the limit fail immediately (the limit must be at least 2048 MB)",
+            default=False
+    )
+    parser.add_argument(
+            '-w', '--workers',
+            metavar="N",
+            nargs=1,
+            type=int,
+            help="Number of processes used to invert reduced mappings (algorithms using CRT) " +
+                 "or coordinates (method 'parallel') in parallel, default value is None - " +
+                 "reduced mappings are inverted one by one and method 'parallel' uses all cores",
+            default=None,
+            required=False
+    )
+    parser.add_argument(
+            '-c', '--analysis-cache',
+            metavar="DIR",
+            nargs=1,
+            type=str,
+            help="Directory where results of analysis of the mapping (degrees, Segre homotopy, " +
+                 "reduced mappings, jacobian) are saved and reused by next runs, default value is None - " +
+                 "results are not saved",
+            default=None,
+            required=False
+    )
+    parser.add_argument(
+            '--cache',
+            metavar="DIR",
+            nargs=1,
+            type=str,
+            help="Directory where inverses (and inverses of reduced mappings for algorithms using CRT) are saved " +
+                 "and reused by next runs, default value is None - results are not saved",
+            default=None,
+            required=False
+    )
+    parser.add_argument(
+            '--cache-size',
+            metavar="MB",
+            nargs=1,
+            type=int,
+            help=f"Size limit of directory set by option --cache, default value is {RESULT_CACHE_SIZE}",
+            default=None,
+            required=False
+    )
+    parser.add_argument(
+            '--checkpoint',
+            metavar="DIR",
+            nargs=1,
+            type=str,
+            help="Directory where state of ABCH algorithm (and remainders of algorithms using CRT) is saved " +
+                 "periodically, default value is None - state is not saved",
+            default=None,
+            required=False
+    )
+    parser.add_argument(
+            '--checkpoint-interval',
+            metavar="SECONDS",
+            nargs=1,
+            type=int,
+            help=f"Minimal time between two checkpoints, default value is {CHECKPOINT_INTERVAL}",
+            default=None,
+            required=False
+    )
+    parser.add_argument(
+            '--resume',
+            action="store_true",
+            help="Continue computations from the last checkpoint saved in directory set by option --checkpoint",
+            default=False
+    )
+    parser.add_argument(
+            '--trace',
+            metavar="FILE",
+            nargs=1,
+            type=str,
+            help="File (JSON lines) where every step of ABCH algorithm is recorded (time of substitution " +
+                 "and truncation, number of terms, degrees, memory), default value is None - steps are not recorded",
+            default=None,
+            required=False
+    )
+    parser.add_argument(
+            '-p', '--adaptive-primes',
+            action="store_true",
+            help="Algorithms using CRT take prime numbers from generator (instead of list defined for the mapping) " +
+                 "until the result doesn't change",
+            default=False
+    )
+    parser.add_argument(
+            '--stable-primes',
+            metavar="N",
+            nargs=1,
+            type=int,
+            help="Number of additional primes which don't change the result needed to stop adaptive CRT, " +
+                 "default value is 1",
+            default=None,
+            required=False
+    )
+    parser.add_argument(
+            '--max-primes',
+            metavar="N",
+            nargs=1,
+            type=int,
+            help="Maximal number of primes used by adaptive CRT, default value is 64",
+            default=None,
+            required=False
+    )
+    parser.add_argument(
+            '--dense-memory',
+            metavar="MB",
+            nargs=1,
+            type=int,
+            help="Algorithm ABCH_CRT with default method inverts reduced mappings over GF(p) on dense arrays " +
+                 "if they need at most MB megabytes (method 'dense' fails if they need more), default value is 0 " +
+                 "- dense arrays are used only by method 'dense' (limited by option -r)",
+            default=None,
+            required=False
+    )
+    parser.add_argument(
+            '-q', '--rational',
+            action="store_true",
+            help="Algorithms using CRT retrieve rational coefficients using rational reconstruction " +
+                 "instead of clearing denominators with Segre homotopy, it implies option -p",
+            default=False
+    )
 
     required = parser.add_argument_group('required named arguments')
     required.add_argument(
@@ -86,24 +255,44 @@ if __name__ == '__main__':
             choices=list(algorithms.keys()),
             required=True
     )
-    required.add_argument(
+    mapping_source = required.add_mutually_exclusive_group(required=True)
+    mapping_source.add_argument(
             "-m", "--mapping", 
             metavar="MAPPING",
             nargs=1, 
             type=str, 
             help="Choose mapping to study",
-            choices=list(mappings.keys()),
-            required=True
+            choices=list(mappings.keys())
+    )
+    mapping_source.add_argument(
+            "--mapping-file",
+            metavar="FILE",
+            nargs=1,
+            type=str,
+            help="Load mapping to study from mapping file (see mapping_file.py)"
     )
     args = parser.parse_args()
 
-    if not args.algorithm or not args.mapping:
+    if args.hard_memory_limit and (not args.memory or args.memory[0] < MIN_ADDRESS_SPACE_LIMIT):
+        parser.error(f"option --hard-memory-limit requires option -r with at least {MIN_ADDRESS_SPACE_LIMIT} MB " +
+                     "(virtual memory of a fresh Sage process is about 1.7 GB)")
+
+    if args.algorithm and args.method and args.method[0] not in methods[args.algorithm[0]]:
+        parser.error(f"method '{args.method[0]}' is not available for algorithm {args.algorithm[0]} " +
+                     f"(choose from {', '.join(repr(m) for m in methods[args.algorithm[0]])})")
+
+    if not args.algorithm or not (args.mapping or args.mapping_file):
         parser.print_help()
     else:
         algorithm = algorithms[args.algorithm[0]]
-        with open(args.output, "a") as log_file:
-            mapping = mappings[args.mapping[0]]
-            begin = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with open(args.output[0], "a") as log_file:
+            if args.mapping_file is not None and len(args.mapping_file) > 0:
+                mapping_file = args.mapping_file[0]
+                mapping = load_mapping(mapping_file)
+            else:
+                mapping_file = None
+                mapping = mappings[args.mapping[0]]
+            begin = now()
             
             if len(args.method) > 0:
                 meth = args.method[0]
@@ -119,20 +308,80 @@ if __name__ == '__main__':
                 memory_limit = None
             else:
                 memory_limit = args.memory[0]
+
+            if args.workers is None or len(args.workers) == 0:
+                workers = None
+            else:
+                workers = args.workers[0]
+
+            if args.analysis_cache is None or len(args.analysis_cache) == 0:
+                analysis_cache = None
+            else:
+                analysis_cache = args.analysis_cache[0]
+
+            if args.cache is None or len(args.cache) == 0:
+                result_cache = None
+            elif args.cache_size is None or len(args.cache_size) == 0:
+                result_cache = ResultCache(args.cache[0])
+            else:
+                result_cache = ResultCache(args.cache[0], args.cache_size[0])
             
+            options = {}
+            if args.checkpoint is not None and len(args.checkpoint) > 0:
+                if args.checkpoint_interval is not None and len(args.checkpoint_interval) > 0:
+                    interval = args.checkpoint_interval[0]
+                else:
+                    interval = CHECKPOINT_INTERVAL
+                options['checkpoints'] = Checkpoints(args.checkpoint[0], interval, args.resume)
+            if args.trace is not None and len(args.trace) > 0:
+                options['tracer'] = Tracer(args.trace[0])
+            if args.dense_memory is not None and len(args.dense_memory) > 0:
+                options['dense_memory'] = args.dense_memory[0]
+            elif meth == 'dense' and memory_limit is not None:
+                # dense arrays of method 'dense' must fit into memory limit of the process
+                options['dense_memory'] = memory_limit
+            if args.rational:
+                options['rational'] = True
+            # rational reconstruction needs more primes than lists defined for mappings contain
+            if args.adaptive_primes or args.rational:
+                options['adaptive'] = True
+                if args.stable_primes is not None and len(args.stable_primes) > 0:
+                    options['stable_primes'] = args.stable_primes[0]
+                if args.max_primes is not None and len(args.max_primes) > 0:
+                    options['max_primes'] = args.max_primes[0]
+
+            if args.log_coordinates:
+                def log_coordinate(index, g, coordinate):
+                    record = {'event': 'coordinate', 'time': now(), 'algorithm': args.algorithm[0],
+                              'mapping': mapping.name, 'method': meth, **coordinate}
+                    print(write_record(log_file, record))
+                options['on_coordinate'] = log_coordinate
+
+            inverses = []
+            if args.save_inverse is not None and len(args.save_inverse) > 0:
+                options['on_inverse'] = lambda f, g: inverses.append(g)
+
             result = algorithm(
                     mapping=mapping, 
                     debug=args.debug, 
                     verify=args.verify, 
                     method=meth, 
+                    error_probability=args.error_probability[0] if args.error_probability else ERROR_PROBABILITY,
                     check_jacobian=args.jacobian, 
                     timeout=timeout, 
                     memory_limit=memory_limit,
-                    params={"algorithm": args.algorithm[0], "mapping": args.mapping[0], "method": meth}
+                    address_space_limit=args.hard_memory_limit,
+                    workers=workers,
+                    analysis_cache=analysis_cache,
+                    result_cache=result_cache,
+                    **options,
+                    params={"algorithm": args.algorithm[0], "mapping": mapping.name, "mapping_file": mapping_file,
+                            "method": meth, "workers": workers}
             ) 
-            end = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            
-            msg = end + " " + str(result)
-
-            print(msg)
-            log_file.write(msg + "\n")
+            if inverses:
+                # algorithms using CRT invert Segre homotopy of the mapping, name of the inverse tells it
+                g = inverses[0]
+                save_compact(args.save_inverse[0], g, g['state']['name'], is_imaginary=g['state']['imaginary'])
+                result['inverse_file'] = args.save_inverse[0]
+            record = {'begin': begin, 'end': now(), 'environment': environment(), **result}
+            print(write_record(log_file, record))
@@ -2,6 +2,13 @@
 This file contains class describing multivariable polynomial mapping.
 """
 from sage.all import *
+import os
+import sys
+import pickle
+import hashlib
+import numpy
+from truncation import TruncatedPowerCache, graded
+from polynomial_parser import PolynomialParser
 
 
 class Mapping:
@@ -20,6 +27,183 @@ class Mapping:
         self.primes = list_of_primes
         self.r = segre_constant
         self.imaginary = is_imaginary
+        self.power_caches = {}
+        self.analysis = {}
+
+    def __getstate__(self):
+        """
+        Caches are not sent to other processes (results of analysis can be shared using spill_analysis)
+        """
+        state = self.__dict__.copy()
+        state['power_caches'] = {}
+        state['analysis'] = {}
+        return state
+
+    def power_cache(self, degree_limit):
+        """
+        This method returns cache of truncated images of monomials under this mapping.
+        The cache is shared by all calls with the same degree limit.
+        :param degree_limit: boundary for degree
+        :return: object of class TruncatedPowerCache
+        """
+        if degree_limit not in self.power_caches:
+            self.power_caches[degree_limit] = TruncatedPowerCache(self, degree_limit)
+        return self.power_caches[degree_limit]
+
+    def _analyze(self, key, compute):
+        """
+        This method returns cached result of analysis of the mapping, the result is computed on first use
+        :param key: key of the result
+        :param compute: function computing the result
+        :return: result of analysis
+        """
+        if key not in self.analysis:
+            self.analysis[key] = compute()
+        return self.analysis[key]
+
+    def fingerprint(self):
+        """
+        This method calculates hash of the mapping (ring, polynomials, prime numbers and Segre constant)
+        :return: hexadecimal string
+        """
+        def compute():
+            description = repr((str(self.R), [str(f) for f in self.F], list(self.primes), str(self.r), self.imaginary))
+            return hashlib.sha256(description.encode()).hexdigest()
+        return self._analyze('fingerprint', compute)
+
+    def degrees(self):
+        """
+        This method calculates value D, d and list [d_1,...,d_n] (for details see README.md file)
+        :return: tuple: (D, d, [d_1, ..., d_n])
+        """
+        def compute():
+            # we put max int value as d parameter
+            min_d = sys.maxsize
+            max_d = -1
+            lower_degrees = []
+            for f, x in zip(self.F, self.R.gens()):
+                temp_monomials = (f - x).monomials()
+                if len(temp_monomials) == 0:
+                    lower_degrees.append(sys.maxsize)
+                else:
+                    temp_degrees = [m.degree() for m in temp_monomials]
+                    d = min(temp_degrees)
+                    if d < min_d:
+                        min_d = d
+                    dd = max(temp_degrees)
+                    if dd > max_d:
+                        max_d = dd
+                    lower_degrees.append(d)
+            return max_d, min_d, lower_degrees
+        return self._analyze('degrees', compute)
+
+    def degree_limit(self):
+        """
+        This method calculates boundary for degree of the inverse: D^(n-1)
+        :return: boundary for degree
+        """
+        max_d, _, _ = self.degrees()
+        return max_d**(self.n-1)
+
+    def graded_images(self, degree_limit):
+        """
+        This method splits polynomials F_i into homogeneous components of degree at most degree_limit
+        (see function graded), they are computed once and shared by all substitutions
+        :param degree_limit: boundary for degree
+        :return: list of truncated polynomials [{ k => F_i,k }]
+        """
+        return self._analyze(('graded', degree_limit), lambda: [graded(f, degree_limit) for f in self.F])
+
+    def steps_limit(self, index):
+        """
+        This method calculates maximal number of steps of ABCH algorithm for index-th coordinate
+        :param index: index of coordinate
+        :return: maximal number of steps
+        """
+        def compute():
+            max_d, min_d, lower_degrees = self.degrees()
+            if min_d > 1:
+                return [floor((self.degree_limit() - d_i)/(min_d - 1) + 1)+1 for d_i in lower_degrees]
+            return [self.degree_limit()] * self.n
+        return self._analyze('steps_limits', compute)[index]
+
+    def jacobian_determinant(self):
+        """
+        This method calculates determinant of Jacobi matrix
+        :return: polynomial
+        """
+        return self._analyze('jacobian_determinant', lambda: det(jacobian(self.F, self.R.gens())))
+
+    def _export_analysis(self):
+        """
+        This method returns results of analysis together with results of analysis of mappings
+        obtained during analysis (e.g. reduced mappings of Segre homotopy)
+        :return: tuple (analysis, { key => exported analysis of mapping })
+        """
+        nested = {k: v._export_analysis() for k, v in self.analysis.items() if isinstance(v, Mapping)}
+        return dict(self.analysis), nested
+
+    def _import_analysis(self, exported):
+        """
+        This method merges results of analysis exported by method _export_analysis
+        :param exported: tuple (analysis, { key => exported analysis of mapping })
+        """
+        analysis, nested = exported
+        for k, v in analysis.items():
+            if k not in self.analysis:
+                self.analysis[k] = v
+        for k, v in nested.items():
+            self.analysis[k]._import_analysis(v)
+
+    def spill_analysis(self, directory):
+        """
+        This method saves results of analysis on disk, so other runs for the same mapping can use them
+        :param directory: directory with saved analyses
+        """
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, self.fingerprint() + '.analysis')
+        self.load_analysis(directory)
+        temporary_path = f'{path}.{os.getpid()}'
+        with open(temporary_path, 'wb') as f:
+            pickle.dump(self._export_analysis(), f)
+        os.replace(temporary_path, path)
+
+    def load_analysis(self, directory):
+        """
+        This method loads results of analysis saved on disk by method spill_analysis
+        :param directory: directory with saved analyses
+        """
+        path = os.path.join(directory, self.fingerprint() + '.analysis')
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, 'rb') as f:
+                exported = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return
+        self._import_analysis(exported)
+
+    def to_compact(self):
+        """
+        This method serializes the mapping into compact form used to send it between processes
+        (see function compact_polynomials)
+        :return: dictionary (picklable without Sage polynomials)
+        """
+        state = self.__getstate__()
+        del state['F']
+        return {'state': state, **compact_polynomials(self.F, self.n)}
+
+    @staticmethod
+    def from_compact(compact):
+        """
+        This method restores mapping serialized by method to_compact
+        :param compact: dictionary returned by method to_compact
+        :return: object describing mapping
+        """
+        mapping = Mapping.__new__(Mapping)
+        mapping.__dict__.update(compact['state'])
+        mapping.F = restore_polynomials(compact)
+        return mapping
 
     @staticmethod
     def parse(list_of_string_definitions, name='F', field=QQ, list_of_primes=(3, 5, 7), segre_constant=1,
@@ -32,6 +216,7 @@ class Mapping:
         :param list_of_primes: set of prime numbers
         :param segre_constant: number used to clear denominators in Segre homotopy
         :param params: if mapping is parametrized one needs to put number values in place of parameters
+                       (dictionary { name of parameter => string with its value })
         :param variables: name of variables in this mapping, if None defaults are used
         :param is_imaginary: flag if this mapping is defined over field with imaginary part
         """
@@ -41,12 +226,8 @@ class Mapping:
         else:
             variables_out = variables
         ring = PolynomialRing(field, variables_out)
-        f_out = []
-        for f in list_of_string_definitions:
-            temp = ring("0")
-            for m in str(expand(symbolic_expression(str(f).replace("I", "PLACEHOLDER")))).split("+"):
-                temp += ring(Mapping.insert_params(str(m).replace("PLACEHOLDER", "I"), params))
-            f_out.append(temp)
+        parser = PolynomialParser(ring, params)
+        f_out = [parser.parse(f) for f in list_of_string_definitions]
         return Mapping(f_out, name, list_of_primes, segre_constant, is_imaginary)
 
     def check_jacobian(self):
@@ -54,22 +235,7 @@ class Mapping:
         This method checks if determinant of Jacobi matrix is equal to 1
         :return: This method returns when det is equal to 1
         """
-        jacobi_matrix = jacobian(self.F, self.R.gens())
-        dj = det(jacobi_matrix)
-        return dj == 1
-
-    @staticmethod
-    def insert_params(s, d):
-        """
-        This static method is used to insert values of parameters into polynomials in the mapping
-        :param s: string containing definition of polynomial
-        :param d: dictionary containing values of parameters
-        :return:
-        """
-        result = s
-        for k in d:
-            result = result.replace(k, d[k])
-        return result
+        return self.jacobian_determinant() == 1
 
     def __str__(self):
         """
@@ -88,13 +254,23 @@ class Mapping:
         :param inverse_candidate: object describing possible inverse
         :return: This method doesn't return any value - it raises an exception if G is not an inverse of self
         """
-        for g, x in zip(inverse_candidate.F, self.R.gens()):
-            res = g(self.F)
-            if res == 0 or res/x not in CC:
-                print("----------------------------")
-                print(res)
-                print("----------------------------")
-                return False
+        return all(self.check_coordinate(index, g) for index, g in enumerate(inverse_candidate.F))
+
+    def check_coordinate(self, index, g):
+        """
+        This method checks if polynomial g is index-th coordinate of the inverse of self, i.e. g(F) = X_index
+        (up to a constant factor)
+        :param index: index of coordinate
+        :param g: polynomial
+        :return: True if g is correct coordinate of the inverse
+        """
+        x = self.R.gens()[index]
+        res = g(self.F)
+        if res == 0 or res/x not in CC:
+            print("----------------------------")
+            print(res)
+            print("----------------------------")
+            return False
         return True
 
     def segre_homotopy(self):
@@ -102,14 +278,16 @@ class Mapping:
         Function implements Segre homotopy
         :return: new mapping obtained using Segre homotopy
         """
-        if self.R.base_ring() == QQ:
-            field = ZZ
-        else:
-            field = GaussianIntegers()
-        rr = self.R.change_ring(field)
-        new_variables = [self.r * x for x in self.R.gens()]
-        new_mapping = [f(new_variables) / self.r for f in self.F]
-        return Mapping(new_mapping, str(self.r) + self.name, self.primes, 1, self.imaginary, rr)
+        def compute():
+            if self.R.base_ring() == QQ:
+                field = ZZ
+            else:
+                field = GaussianIntegers()
+            rr = self.R.change_ring(field)
+            new_variables = [self.r * x for x in self.R.gens()]
+            new_mapping = [f(new_variables) / self.r for f in self.F]
+            return Mapping(new_mapping, str(self.r) + self.name, self.primes, 1, self.imaginary, rr)
+        return self._analyze('segre_homotopy', compute)
 
     def reduce_mapping(self, p):
         """
@@ -117,8 +295,206 @@ class Mapping:
         :param p: prime number
         :return: new mapping - self reduced modulo p
         """
-        zz = self.R.base_ring()
-        new_field = zz.residue_field(zz(p))
-        red = self.R.hom(self.R.change_ring(new_field))
-        r_fp = [red(f) for f in self.F]
-        return Mapping(r_fp, self.name+"_"+str(p), [], 1, self.imaginary)
+        def compute():
+            zz = self.R.base_ring()
+            new_field = zz.residue_field(zz(p))
+            if zz.is_field():
+                # there is no natural morphism from field of characteristic zero, coefficients are reduced one by one
+                rr = self.R.change_ring(new_field)
+                r_fp = [rr({m: new_field(c) for m, c in f.dict().items()}) for f in self.F]
+            else:
+                red = self.R.hom(self.R.change_ring(new_field))
+                r_fp = [red(f) for f in self.F]
+            return Mapping(r_fp, self.name+"_"+str(p), [], 1, self.imaginary)
+        return self._analyze(('reduced', p), compute)
+
+    def is_good_prime(self, p):
+        """
+        This function checks if mapping F can be reduced modulo p, i.e. p doesn't divide denominators of coefficients
+        :param p: prime number
+        :return: True if mapping can be reduced modulo p
+        """
+        if not self.R.base_ring().is_field():
+            return True
+        return all(c.denominator() % p != 0 for f in self.F for c in f.coefficients())
+
+
+class MappingTemplate:
+    """
+    Class describing family of mappings defined by polynomials with parameters.
+    Definitions are parsed once (over field of rational functions of parameters), so the ring, supports
+    of polynomials and degrees of their terms are computed once and shared by all instances of the family.
+    """
+
+    def __init__(self, list_of_string_definitions, name, params, field=QQ, list_of_primes=(3, 5, 7),
+                 segre_constant=1, variables=None, is_imaginary=False):
+        """
+        :param list_of_string_definitions: list of strings where each string describes one polynomial in mapping
+        :param name: name of the family, it is also name of the default instance
+        :param params: dictionary { name of parameter => string with its default value }
+        :param field: mappings are defined over this field
+        :param list_of_primes: set of prime numbers
+        :param segre_constant: number used to clear denominators in Segre homotopy of the default instance
+        :param variables: name of variables in this mapping, if None defaults are used
+        :param is_imaginary: flag if this mapping is defined over field with imaginary part
+        """
+        if not params:
+            raise ValueError(f'Template {name} has no parameters')
+        self.definitions = list_of_string_definitions
+        self.name = name
+        self.params = dict(params)
+        self.field = field
+        self.primes = list_of_primes
+        self.r = segre_constant
+        self.imaginary = is_imaginary
+        if variables is None:
+            self.variables = [f'X{j+1}' for j in range(len(list_of_string_definitions))]
+        else:
+            self.variables = variables
+        self.ring = None
+        self.terms = None
+
+    def supports(self):
+        """
+        This method parses definitions (only once) and returns terms of H_i = F_i - X_i
+        :return: list (one element for every coordinate) of lists of tuples
+                 (exponents, degree, numerator, denominator), numerator and denominator are polynomials of parameters
+        """
+        if self.terms is None:
+            parameter_field = PolynomialRing(self.field, list(self.params)).fraction_field()
+            generic_ring = PolynomialRing(parameter_field, self.variables)
+            parser = PolynomialParser(generic_ring, dict(zip(self.params, parameter_field.gens())))
+            self.ring = PolynomialRing(self.field, self.variables)
+            self.terms = []
+            for definition, x in zip(self.definitions, generic_ring.gens()):
+                h = parser.parse(definition) - x
+                self.terms.append([(m, sum(m), c.numerator(), c.denominator()) for m, c in h.dict().items()])
+        return self.terms
+
+    def instance_name(self, values):
+        """
+        This method returns name of instance of the family
+        :param values: dictionary { name of parameter => its value }, other parameters have default values
+        :return: name of the family followed by values which are not default, e.g. H1(a4=2,b4=1/2)
+        """
+        changed = [f'{k}={values[k]}' for k in self.params if k in values and str(values[k]) != self.params[k]]
+        return f'{self.name}({",".join(changed)})' if changed else self.name
+
+    def instance(self, values=None):
+        """
+        This method creates instance of the family. Coefficients are evaluated at values of parameters,
+        degrees of the mapping (see method Mapping.degrees) are obtained from the supports and Segre constant
+        is multiplied by denominators which it doesn't clear
+        :param values: dictionary { name of parameter => string with its value (or the value) },
+                       other parameters have default values
+        :return: object describing mapping
+        :raise ValueError: if parameter is unknown or denominator of some coefficient vanishes
+        """
+        values = dict(values or {})
+        unknown = [k for k in values if k not in self.params]
+        if unknown:
+            raise ValueError(f'Unknown parameters {unknown} of {self.name}')
+        terms = self.supports()
+        name = self.instance_name(values)
+        constants = PolynomialParser(self.ring, {**self.params, **values}).params
+        point = [constants[k] for k in self.params]
+        segre_constant = self.r
+        f = []
+        max_d = -1
+        min_d = sys.maxsize
+        lower_degrees = []
+        for x, coordinate_terms in zip(self.ring.gens(), terms):
+            h = {}
+            degrees = []
+            for m, degree, numerator, denominator in coordinate_terms:
+                divisor = denominator(*point)
+                if divisor == 0:
+                    raise ValueError(f'Denominator {denominator} of coefficient in {name} vanishes')
+                c = numerator(*point) / divisor
+                if c == 0:
+                    continue
+                h[m] = c
+                degrees.append(degree)
+                if degree > 1:
+                    # Segre homotopy multiplies coefficient of term of degree k by r^(k-1)
+                    segre_constant *= int((c * segre_constant**(degree - 1)).denominator())
+            f.append(x + self.ring(h))
+            lower_degrees.append(min(degrees) if degrees else sys.maxsize)
+            min_d = min(degrees + [min_d])
+            max_d = max(degrees + [max_d])
+        mapping = Mapping(f, name, self.primes, segre_constant, self.imaginary)
+        mapping.analysis['degrees'] = (max_d, min_d, lower_degrees)
+        return mapping
+
+
+def compact_polynomials(polynomials, n):
+    """
+    This function serializes polynomials into compact form used to send them between processes:
+    exponents of all terms in one integer array and coefficients as lists of numerators and denominators
+    (every coefficient is split into its coordinates, e.g. real and imaginary part)
+    :param polynomials: list of polynomials from the same ring
+    :param n: number of variables
+    :return: dictionary (picklable without Sage polynomials)
+    """
+    ring = polynomials[0].parent() if polynomials else None
+    terms = [f.dict() for f in polynomials]
+    if ring is not None and ring.base_ring().is_finite():
+        parts = [[ZZ(x) for x in (c.list() if hasattr(c, 'list') else c._vector_())]
+                 for t in terms for c in t.values()]
+    else:
+        parts = [[QQ(x) for x in c.list()] for t in terms for c in t.values()]
+    return {
+        'ring': ring,
+        'lengths': numpy.array([len(t) for t in terms], dtype=numpy.int64),
+        'exponents': numpy.array([m for t in terms for m in t.keys()], dtype=numpy.int32).reshape(-1, n),
+        'numerators': [int(x.numerator()) for c in parts for x in c],
+        'denominators': [int(x.denominator()) for c in parts for x in c],
+        'width': len(parts[0]) if parts else 1
+    }
+
+
+def restore_polynomials(compact):
+    """
+    This function restores polynomials serialized by function compact_polynomials
+    :param compact: dictionary returned by function compact_polynomials
+    :return: list of polynomials
+    """
+    ring = compact['ring']
+    width = compact['width']
+    values = [a if b == 1 else QQ(a) / b for a, b in zip(compact['numerators'], compact['denominators'])]
+    if ring is not None and width > 1:
+        coefficients = [ring.base_ring()(values[i:i + width]) for i in range(0, len(values), width)]
+    elif ring is not None:
+        coefficients = [ring.base_ring()(v) for v in values]
+    f = []
+    start = 0
+    for length in compact['lengths']:
+        stop = start + int(length)
+        # converting the whole array at once is much faster than converting exponents one by one
+        f.append(ring(dict(zip(map(tuple, compact['exponents'][start:stop].tolist()), coefficients[start:stop]))))
+        start = stop
+    return f
+
+
+def split_compact(compact):
+    """
+    This function splits polynomials serialized by function compact_polynomials (or mapping serialized
+    by method Mapping.to_compact) into separately serialized polynomials, without restoring them
+    :param compact: dictionary returned by function compact_polynomials
+    :return: list of dictionaries, one for every polynomial
+    """
+    width = compact['width']
+    result = []
+    start = 0
+    for length in compact['lengths']:
+        stop = start + int(length)
+        result.append({
+            'ring': compact['ring'],
+            'lengths': compact['lengths'][len(result):len(result) + 1],
+            'exponents': compact['exponents'][start:stop],
+            'numerators': compact['numerators'][start * width:stop * width],
+            'denominators': compact['denominators'][start * width:stop * width],
+            'width': width
+        })
+        start = stop
+    return result
@@ -0,0 +1,200 @@
+"""
+This file contains binary file format of mappings, used to load mappings which are not defined in mappings.py
+and to save computed inverses.
+The file starts with MAGIC, length of the header (8 bytes, little endian) and the header (JSON) describing the ring
+(variables, term order, coefficient domain), name, prime numbers, Segre constant and arrays stored after the header.
+Arrays (aligned to ALIGNMENT bytes) contain polynomials in compact form (see function compact_polynomials
+in mapping.py): numbers of terms, exponents of all terms and numerators and denominators of coefficients
+(as 64-bit integers, or as signed integers of fixed number of bytes if some of them don't fit).
+Arrays are memory-mapped by the loader, so loading doesn't parse anything.
+See details in README.md file.
+"""
+from sage.all import *
+import os
+import json
+import numpy
+from mapping import Mapping, compact_polynomials, restore_polynomials
+
+
+MAGIC = b'ALGRMAP1'
+# arrays are aligned to this number of bytes
+ALIGNMENT = 64
+# integers of absolute value below this bound are stored as 64-bit integers
+INT64_BOUND = 2**63
+
+
+def _aligned(size):
+    return -(-size // ALIGNMENT) * ALIGNMENT
+
+
+def _describe_field(field):
+    """
+    This function describes coefficient domain of the mapping
+    :param field: base ring of the polynomial ring
+    :return: dictionary (serializable to JSON)
+    :raise ValueError: if the domain is not supported
+    """
+    if field == ZZ:
+        return {'type': 'integer'}
+    if field == QQ:
+        return {'type': 'rational'}
+    if field == GaussianIntegers():
+        return {'type': 'gaussian_integer'}
+    if field == GaussianIntegers().fraction_field():
+        return {'type': 'gaussian'}
+    if field.is_finite() and field.is_prime_field():
+        return {'type': 'prime', 'order': int(field.order())}
+    raise ValueError(f'Coefficients from {field} cannot be stored in mapping file')
+
+
+def _field(description):
+    """
+    This function restores coefficient domain described by function _describe_field
+    """
+    if description['type'] == 'integer':
+        return ZZ
+    if description['type'] == 'rational':
+        return QQ
+    if description['type'] == 'gaussian_integer':
+        return GaussianIntegers()
+    if description['type'] == 'gaussian':
+        return GaussianIntegers().fraction_field()
+    if description['type'] == 'prime':
+        return GF(description['order'])
+    raise ValueError(f'Unknown coefficient domain {description}')
+
+
+def _encode_integers(values):
+    """
+    This function stores integers in an array
+    :param values: list of integers
+    :return: tuple (array, number of bytes of every integer or 0 if they are stored as 64-bit integers)
+    """
+    if all(-INT64_BOUND <= v < INT64_BOUND for v in values):
+        return numpy.array(values, dtype=numpy.int64), 0
+    size = max(abs(v).bit_length() for v in values) // 8 + 1
+    data = b''.join(v.to_bytes(size, 'little', signed=True) for v in values)
+    return numpy.frombuffer(data, dtype=numpy.uint8).reshape(-1, size), size
+
+
+def _decode_integers(array, size):
+    """
+    This function restores integers stored by function _encode_integers
+    """
+    if size == 0:
+        return array.tolist()
+    data = array.tobytes()
+    return [int.from_bytes(data[i:i + size], 'little', signed=True) for i in range(0, len(data), size)]
+
+
+def save_compact(path, compact, name, list_of_primes=(), segre_constant=1, is_imaginary=False):
+    """
+    This function saves polynomials of the mapping in compact form into mapping file
+    :param path: path of the file
+    :param compact: dictionary returned by function compact_polynomials
+    :param name: name of the mapping
+    :param list_of_primes: set of prime numbers
+    :param segre_constant: number used to clear denominators in Segre homotopy
+    :param is_imaginary: flag if this mapping is defined over field with imaginary part
+    :raise ValueError: if coefficients of the mapping cannot be stored
+    """
+    ring = compact['ring']
+    arrays = {
+        'lengths': numpy.asarray(compact['lengths'], dtype=numpy.int64),
+        'exponents': numpy.ascontiguousarray(compact['exponents'], dtype=numpy.int32)
+    }
+    header = {
+        'name': name,
+        'variables': [str(x) for x in ring.gens()],
+        'order': ring.term_order().name() if ring.ngens() > 1 else None,
+        'field': _describe_field(ring.base_ring()),
+        'primes': [int(p) for p in list_of_primes],
+        'segre_constant': str(segre_constant),
+        'is_imaginary': bool(is_imaginary),
+        'width': int(compact['width']),
+        'arrays': {}
+    }
+    arrays['numerators'], header['numerator_bytes'] = _encode_integers(compact['numerators'])
+    arrays['denominators'], header['denominator_bytes'] = _encode_integers(compact['denominators'])
+    offset = 0
+    for key, array in arrays.items():
+        header['arrays'][key] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset += _aligned(array.nbytes)
+    encoded = json.dumps(header).encode()
+    data_start = _aligned(len(MAGIC) + 8 + len(encoded))
+    temporary_path = f'{path}.{os.getpid()}'
+    with open(temporary_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(len(encoded).to_bytes(8, 'little'))
+        f.write(encoded)
+        for key, array in arrays.items():
+            f.seek(data_start + header['arrays'][key]['offset'])
+            f.write(array.tobytes())
+        f.truncate(data_start + offset)
+    os.replace(temporary_path, path)
+
+
+def save_mapping(path, mapping):
+    """
+    This function saves the mapping into mapping file
+    :param path: path of the file
+    :param mapping: object describing mapping
+    :raise ValueError: if coefficients of the mapping cannot be stored
+    """
+    save_compact(path, compact_polynomials(mapping.F, mapping.n), mapping.name, mapping.primes, mapping.r,
+                 mapping.imaginary)
+
+
+def load_compact(path):
+    """
+    This function loads mapping file without restoring polynomials, arrays of exponents are memory-mapped
+    :param path: path of the file
+    :return: dictionary in the form returned by function compact_polynomials (so it can be evaluated
+             by functions in probabilistic_check.py) with additional keys 'name', 'primes', 'segre_constant'
+             and 'is_imaginary'
+    :raise ValueError: if the file is not a mapping file
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'{path} is not a mapping file')
+        size = int.from_bytes(f.read(8), 'little')
+        header = json.loads(f.read(size))
+    data_start = _aligned(len(MAGIC) + 8 + size)
+    arrays = {}
+    for key, description in header['arrays'].items():
+        shape = tuple(description['shape'])
+        if numpy.prod(shape) == 0:
+            arrays[key] = numpy.zeros(shape, dtype=description['dtype'])
+        else:
+            arrays[key] = numpy.memmap(path, dtype=description['dtype'], mode='r',
+                                       offset=data_start + description['offset'], shape=shape)
+    field = _field(header['field'])
+    if header['order'] is None:
+        ring = PolynomialRing(field, header['variables'])
+    else:
+        ring = PolynomialRing(field, header['variables'], order=header['order'])
+    segre_constant = QQ(header['segre_constant'])
+    return {
+        'ring': ring,
+        'lengths': arrays['lengths'],
+        'exponents': arrays['exponents'],
+        'numerators': _decode_integers(arrays['numerators'], header['numerator_bytes']),
+        'denominators': _decode_integers(arrays['denominators'], header['denominator_bytes']),
+        'width': header['width'],
+        'name': header['name'],
+        'primes': header['primes'],
+        'segre_constant': int(segre_constant) if segre_constant in ZZ else segre_constant,
+        'is_imaginary': header['is_imaginary']
+    }
+
+
+def load_mapping(path):
+    """
+    This function loads the mapping from mapping file
+    :param path: path of the file
+    :return: object describing mapping
+    :raise ValueError: if the file is not a mapping file
+    """
+    compact = load_compact(path)
+    return Mapping(restore_polynomials(compact), compact['name'], compact['primes'], compact['segre_constant'],
+                   compact['is_imaginary'], ring=compact['ring'])
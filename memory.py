@@ -0,0 +1,79 @@
+"""
+This file contains functions measuring and limiting memory used by processes executing the algorithms.
+Resident memory of the whole tree of processes (e.g. pool of workers) is read from /proc filesystem,
+so it can be sampled with high frequency, and every process reports its own peak (high-water mark) of resident memory,
+so short spikes between samples are also taken into account.
+See details in README.md file.
+"""
+import os
+import resource
+import psutil
+
+
+# time (in seconds) between two measurements of memory
+MEMORY_INTERVAL = 0.01
+# number of measurements between two refreshes of the list of processes in the tree
+TREE_INTERVAL = 10
+MEMORY_DIGITS = 2
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+MB = 2**20
+# minimal limit (in MB) of virtual memory, a fresh Sage process uses about 1.7 GB of address space,
+# so lower limits make every allocation (even import of a module) fail
+MIN_ADDRESS_SPACE_LIMIT = 2048
+
+
+def rss(pid):
+    """
+    This function reads resident memory of the process
+    :param pid: identifier of the process
+    :return: number of bytes (0 if the process doesn't exist)
+    """
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+def process_tree(pid):
+    """
+    This function lists the process and all its descendants
+    :param pid: identifier of the process
+    :return: list of identifiers (empty if the process doesn't exist)
+    """
+    try:
+        return [pid] + [child.pid for child in psutil.Process(pid).children(recursive=True)]
+    except psutil.NoSuchProcess:
+        return []
+
+
+def tree_rss(pids):
+    """
+    This function calculates resident memory of processes
+    :param pids: list of identifiers of processes
+    :return: memory in MB
+    """
+    return sum(rss(pid) for pid in pids) / MB
+
+
+def peak_rss():
+    """
+    This function returns peak of resident memory of the current process and its finished children
+    (the biggest of them), as reported by the kernel. Process created by fork starts with resident memory
+    of its parent, so the peak includes memory inherited from the parent (e.g. Sage and loaded mappings)
+    :return: memory in MB
+    """
+    self_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children_peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss is given in kilobytes
+    return round(max(self_peak, children_peak) / 1024, MEMORY_DIGITS)
+
+
+def limit_address_space(memory_limit):
+    """
+    This function sets hard limit of virtual memory (RLIMIT_AS) of the current process (inherited by its children),
+    allocations above the limit fail (MemoryError in Python)
+    :param memory_limit: limit in MB, it should be at least MIN_ADDRESS_SPACE_LIMIT
+    """
+    limit = memory_limit * MB
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
@@ -0,0 +1,197 @@
+"""
+This file contains parser building polynomials directly in given polynomial ring.
+Grammar of the definitions (^ and ** are both exponentiation, right associative, binding stronger than unary minus):
+    sum     := product (('+' | '-') product)*
+    product := unary (('*' | '/') unary)*
+    unary   := ('+' | '-') unary | power
+    power   := atom (('^' | '**') unary)?
+    atom    := number | name | '(' sum ')'
+Numbers are integers (rational coefficients are written as fractions). Names are variables of the ring,
+parameters (their values are parsed once as constants) or imaginary unit I.
+Only constants can be divisors and exponents must be integers (negative only for constants).
+"""
+from sage.all import *
+import re
+
+
+TOKEN = re.compile(r'(?:(?P<number>\d+)|(?P<name>[A-Za-z_]\w*)|(?P<operator>\*\*|[-+*/^()]))')
+
+
+def tokenize(text):
+    """
+    This function splits definition of polynomial into tokens
+    :param text: string containing definition of polynomial
+    :return: list of tuples (kind, value, position), kind is 'number', 'name', 'operator' or 'end'
+    :raise ValueError: if the text contains unexpected character
+    """
+    tokens = []
+    position = 0
+    while True:
+        while position < len(text) and text[position].isspace():
+            position += 1
+        if position == len(text):
+            break
+        match = TOKEN.match(text, position)
+        if match is None:
+            raise ValueError(f'Unexpected character {text[position]!r} at position {position}')
+        tokens.append((match.lastgroup, match.group(), position))
+        position = match.end()
+    tokens.append(('end', '', position))
+    return tokens
+
+
+class PolynomialParser:
+    """
+    Class describing recursive-descent parser of polynomials in given ring
+    """
+
+    def __init__(self, ring, params=None):
+        """
+        :param ring: polynomial ring in which polynomials are built
+        :param params: dictionary { name of parameter => string with its value (or the value) }
+        """
+        self.ring = ring
+        self.field = ring.base_ring()
+        self.names = {str(x): x for x in ring.gens()}
+        self.imaginary_unit = None
+        self.params = {}
+        for name, value in (params or {}).items():
+            if isinstance(value, str):
+                constant = self._constant(PolynomialParser(ring).parse(value))
+            else:
+                constant = self.field(value)
+            if constant is None:
+                raise ValueError(f'Value of parameter {name} is not constant: {value}')
+            self.params[name] = constant
+        self.tokens = []
+        self.position = 0
+
+    def parse(self, text):
+        """
+        This method parses definition of polynomial
+        :param text: string containing definition of polynomial
+        :return: polynomial in the ring
+        :raise ValueError: if the definition is not correct
+        """
+        self.tokens = tokenize(str(text))
+        self.position = 0
+        result = self._sum()
+        if self.tokens[self.position][0] != 'end':
+            self._error('Unexpected token')
+        return self.ring(result)
+
+    def _error(self, message, index=None):
+        kind, value, position = self.tokens[self.position if index is None else index]
+        raise ValueError(f'{message} at position {position}' + (f' ({value!r})' if value else ''))
+
+    def _next(self):
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def _accept(self, *operators):
+        kind, value, _ = self.tokens[self.position]
+        if kind == 'operator' and value in operators:
+            self.position += 1
+            return value
+        return None
+
+    def _constant(self, value):
+        """
+        This method returns value as an element of the field or None if it is not constant
+        """
+        if value.parent() is self.ring:
+            return self.field(value.constant_coefficient()) if value.is_constant() else None
+        return self.field(value)
+
+    def _sum(self):
+        # terms are collected and added at once, which is much faster than adding them one by one
+        terms = [self._product()]
+        while True:
+            operator = self._accept('+', '-')
+            if operator is None:
+                break
+            term = self._product()
+            terms.append(term if operator == '+' else -term)
+        if len(terms) == 1:
+            return terms[0]
+        constants = [t for t in terms if t.parent() is not self.ring]
+        polynomials = [t for t in terms if t.parent() is self.ring]
+        return self.ring.sum(polynomials) + sum(constants, self.field(0))
+
+    def _product(self):
+        result = self._unary()
+        while True:
+            operator = self._accept('*', '/')
+            if operator is None:
+                return result
+            start = self.position
+            factor = self._unary()
+            if operator == '*':
+                result = result * factor
+                continue
+            divisor = self._constant(factor)
+            if divisor is None:
+                self._error('Division by non-constant polynomial', start)
+            if divisor == 0:
+                self._error('Division by zero', start)
+            result = result * divisor**(-1)
+
+    def _unary(self):
+        operator = self._accept('+', '-')
+        if operator is None:
+            return self._power()
+        value = self._unary()
+        return value if operator == '+' else -value
+
+    def _power(self):
+        base = self._atom()
+        if self._accept('^', '**') is None:
+            return base
+        start = self.position
+        exponent = self._constant(self._unary())
+        if exponent is None or exponent not in ZZ:
+            self._error('Exponent is not an integer', start)
+        exponent = ZZ(exponent)
+        if exponent < 0 and self._constant(base) is None:
+            self._error('Negative exponent of non-constant polynomial', start)
+        return base**exponent
+
+    def _atom(self):
+        kind, value, _ = self._next()
+        if kind == 'number':
+            return self.field(ZZ(value))
+        if kind == 'name':
+            if value in self.names:
+                return self.names[value]
+            if value in self.params:
+                return self.params[value]
+            if value == 'I':
+                return self._imaginary_unit()
+            self._error('Unknown name', self.position - 1)
+        if kind == 'operator' and value == '(':
+            result = self._sum()
+            if self._accept(')') is None:
+                self._error('Expected ")"')
+            return result
+        self._error('Unexpected token', self.position - 1)
+
+    def _imaginary_unit(self):
+        if self.imaginary_unit is None:
+            try:
+                self.imaginary_unit = self.field(I)
+            except (TypeError, ValueError):
+                self._error(f'Imaginary unit is not an element of {self.field}', self.position - 1)
+        return self.imaginary_unit
+
+
+def parse_polynomial(text, ring, params=None):
+    """
+    This function builds polynomial in the ring from its definition
+    :param text: string containing definition of polynomial
+    :param ring: polynomial ring
+    :param params: dictionary { name of parameter => string with its value }
+    :return: polynomial in the ring
+    :raise ValueError: if the definition is not correct
+    """
+    return PolynomialParser(ring, params).parse(text)
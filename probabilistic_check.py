@@ -0,0 +1,189 @@
+"""
+This file contains probabilistic verification of the inverse and of the jacobian based on Schwartz-Zippel lemma.
+Instead of composing G_i(F) symbolically, G_i(F(a)) is compared with a_i at random points a modulo random primes,
+and instead of the symbolic determinant of Jacobi matrix, determinants of the matrix at random points are computed.
+Polynomials are evaluated directly from compact form (see function compact_polynomials in mapping.py)
+on NumPy arrays. For mappings with imaginary part Gaussian integers modulo prime p = 3 mod 4 are used
+(they form field GF(p^2)), so the points are taken from GF(p^2).
+See details in README.md file.
+"""
+from sage.all import *
+from math import ceil, log
+import numpy
+from mapping import compact_polynomials
+
+
+# default probability that wrong coordinate of the inverse (or wrong jacobian) is accepted
+ERROR_PROBABILITY = 1e-12
+# number of random primes, every prime gets enough points to reach the error probability
+VERIFICATION_PRIMES = 2
+# primes are taken from [PRIME_LOWER_BOUND, PRIME_UPPER_BOUND), so product of two remainders fits into int64
+PRIME_LOWER_BOUND = 2**30
+PRIME_UPPER_BOUND = 2**31
+
+
+def random_verification_prime(is_imaginary):
+    """
+    This function draws random prime number used for verification
+    :param is_imaginary: flag if mapping is defined over field with imaginary part (then p = 3 mod 4)
+    :return: prime number
+    """
+    while True:
+        p = int(random_prime(PRIME_UPPER_BOUND - 1, lbound=PRIME_LOWER_BOUND))
+        if not is_imaginary or p % 4 == 3:
+            return p
+
+
+def degree(compact):
+    """
+    This function calculates degree of polynomials in compact form
+    :param compact: dictionary returned by function compact_polynomials
+    :return: maximal degree of terms (0 if there are no terms)
+    """
+    exponents = compact['exponents']
+    return int(exponents.sum(axis=1).max()) if len(exponents) else 0
+
+
+def points_needed(degree_bound, p, error_probability):
+    """
+    This function calculates number of random points needed to detect nonzero polynomial
+    :param degree_bound: boundary for degree of the polynomial
+    :param p: prime number, points are taken from the field of at least p elements
+    :param error_probability: probability that nonzero polynomial vanishes at all the points
+    :return: number of points
+    """
+    # Schwartz-Zippel: nonzero polynomial of degree d vanishes at random point with probability at most d/p
+    if degree_bound >= p:
+        raise ValueError(f'Degree {degree_bound} is too big for probabilistic verification modulo {p}')
+    return max(1, ceil(log(error_probability) / log(max(degree_bound, 1) / p)))
+
+
+def _multiply(x, y, p):
+    """
+    This function multiplies arrays of numbers modulo p, the last axis contains real (and imaginary) part
+    """
+    if x.shape[-1] == 1:
+        return x * y % p
+    re = (x[..., 0] * y[..., 0] % p - x[..., 1] * y[..., 1] % p) % p
+    im = (x[..., 0] * y[..., 1] % p + x[..., 1] * y[..., 0] % p) % p
+    return numpy.stack([re, im], axis=-1)
+
+
+def reduce_coefficients(compact, p, width):
+    """
+    This function reduces coefficients of polynomials in compact form modulo p
+    :param compact: dictionary returned by function compact_polynomials
+    :param p: prime number
+    :param width: 1 for real coefficients, 2 for coefficients with imaginary part
+    :return: array of shape (terms, width)
+    :raise ValueError: if p divides denominator of some coefficient
+    """
+    values = [a * pow(b, -1, p) % p for a, b in zip(compact['numerators'], compact['denominators'])]
+    coefficients = numpy.array(values, dtype=numpy.int64).reshape(-1, compact['width'])
+    if compact['width'] < width:
+        coefficients = numpy.hstack([coefficients, numpy.zeros((len(coefficients), 1), dtype=numpy.int64)])
+    return coefficients
+
+
+def evaluate(compact, points, p):
+    """
+    This function evaluates polynomials in compact form at points modulo p
+    :param compact: dictionary returned by function compact_polynomials
+    :param points: array of shape (number of points, n, width)
+    :param p: prime number
+    :return: array of shape (number of polynomials, number of points, width)
+    :raise ValueError: if p divides denominator of some coefficient
+    """
+    k, n, width = points.shape
+    exponents = compact['exponents']
+    coefficients = reduce_coefficients(compact, p, width)
+    one = numpy.zeros((k, width), dtype=numpy.int64)
+    one[:, 0] = 1
+    terms = numpy.broadcast_to(coefficients[:, None, :], (len(exponents), k, width))
+    for j in range(n):
+        if len(exponents) == 0 or exponents[:, j].max() == 0:
+            continue
+        # powers[e] = a_j^e for every point
+        powers = [one]
+        for _ in range(int(exponents[:, j].max())):
+            powers.append(_multiply(powers[-1], points[:, j, :], p))
+        terms = _multiply(terms, numpy.stack(powers)[exponents[:, j]], p)
+    # sums of terms of every polynomial (terms are smaller than 2^31, so the sums fit into int64)
+    sums = numpy.concatenate([numpy.zeros((1, k, width), dtype=numpy.int64), numpy.cumsum(terms, axis=0)])
+    stops = numpy.cumsum(compact['lengths'])
+    starts = stops - compact['lengths']
+    return (sums[stops] - sums[starts]) % p
+
+
+def check_coordinate(f, index, g, error_probability=ERROR_PROBABILITY, primes=VERIFICATION_PRIMES):
+    """
+    This function checks probabilistically if polynomial g is index-th coordinate of the inverse of mapping F,
+    i.e. G_index(F(a)) = a_index at random points a modulo VERIFICATION_PRIMES random primes.
+    Wrong coordinate is accepted with probability at most error_probability
+    (unless all the primes divide all coefficients of G_index(F) - X_index).
+    :param f: mapping F in compact form (see method Mapping.to_compact)
+    :param index: index of coordinate
+    :param g: polynomial in compact form (see function compact_polynomials)
+    :param error_probability: probability that wrong coordinate is accepted
+    :param primes: number of random primes
+    :return: True if g passed the test
+    """
+    width = max(f['width'], g['width'])
+    n = f['exponents'].shape[1]
+    degree_bound = degree(g) * degree(f)
+    checked = 0
+    while checked < primes:
+        p = random_verification_prime(width > 1)
+        k = points_needed(degree_bound, p, error_probability)
+        points = numpy.random.default_rng().integers(0, p, size=(k, n, width), dtype=numpy.int64)
+        try:
+            images = evaluate(f, points, p)
+            values = evaluate(g, images.transpose(1, 0, 2), p)
+        except ValueError:
+            # p divides denominator of some coefficient, other prime is drawn
+            continue
+        if not numpy.array_equal(values[0], points[:, index, :]):
+            return False
+        checked += 1
+    return True
+
+
+def check_jacobian(mapping, error_probability=ERROR_PROBABILITY, primes=VERIFICATION_PRIMES):
+    """
+    This function checks probabilistically if determinant of Jacobi matrix of mapping F is equal to 1,
+    i.e. det J(a) = 1 at random points a modulo random primes. Partial derivatives are evaluated at the points
+    and only determinants of matrices of numbers are computed (the symbolic determinant is never computed).
+    :param mapping: object describing mapping defined over field of characteristic zero
+    :param error_probability: probability that mapping with other determinant is accepted
+    :param primes: number of random primes
+    :return: True if mapping passed the test
+    """
+    n = mapping.n
+    compact = compact_polynomials([f.derivative(x) for f in mapping.F for x in mapping.R.gens()], n)
+    width = 2 if mapping.imaginary else compact['width']
+    # every entry in i-th row has degree at most deg(F_i) - 1
+    degree_bound = sum(max(f.degree() - 1, 0) for f in mapping.F)
+    checked = 0
+    while checked < primes:
+        p = random_verification_prime(width > 1)
+        k = points_needed(degree_bound, p, error_probability)
+        points = numpy.random.default_rng().integers(0, p, size=(k, n, width), dtype=numpy.int64)
+        try:
+            values = evaluate(compact, points, p)
+        except ValueError:
+            # p divides denominator of some coefficient, other prime is drawn
+            continue
+        if width > 1:
+            # Gaussian integers modulo p = 3 mod 4 are field GF(p^2) = GF(p)[I]
+            field = GF(p**2, 'I', modulus=PolynomialRing(GF(p), 'z')([1, 0, 1]))
+        else:
+            field = GF(p)
+        for point in range(k):
+            if width > 1:
+                entries = [field([int(v) for v in values[entry, point]]) for entry in range(n * n)]
+            else:
+                entries = [field(int(values[entry, point, 0])) for entry in range(n * n)]
+            if matrix(field, n, n, entries).det() != 1:
+                return False
+        checked += 1
+    return True
@@ -0,0 +1,198 @@
+"""
+This file contains tool aggregating results logged by main.py and batch.py (see results_log.py)
+and comparing durations and memory usage between two revisions of our program or two log files.
+It doesn't need Sage. See details in README.md file.
+"""
+import os
+import textwrap
+from statistics import median
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+from results_log import LOG_FILE, read_records
+
+
+GROUP_BY = ('algorithm', 'mapping', 'method')
+
+
+def group_key(record):
+    """
+    This function returns key of the group of runs (algorithm, mapping, method)
+    """
+    return tuple(str(record.get(k, '')) for k in GROUP_BY)
+
+
+def revision(record):
+    """
+    This function returns git revision of program which logged the record (None for old records)
+    """
+    return (record.get('environment') or {}).get('revision')
+
+
+def select(records, *, list_of_algorithms=None, list_of_mappings=None, list_of_methods=None, revision_prefix=None):
+    """
+    This function filters records
+    :param records: list of dictionaries
+    :param list_of_algorithms: names of algorithms, if None all algorithms are taken
+    :param list_of_mappings: names of mappings, if None all mappings are taken
+    :param list_of_methods: names of methods, if None all methods are taken
+    :param revision_prefix: prefix of git revision, if None all revisions are taken
+    :return: list of dictionaries
+    """
+    algorithm, mapping, method = GROUP_BY
+    # events logged during the run (e.g. computed coordinates) aren't results of runs
+    return [r for r in records if 'event' not in r
+            and (list_of_algorithms is None or r.get(algorithm) in list_of_algorithms)
+            and (list_of_mappings is None or r.get(mapping) in list_of_mappings)
+            and (list_of_methods is None or r.get(method, '') in list_of_methods)
+            and (revision_prefix is None or (revision(r) or '').startswith(revision_prefix))]
+
+
+def aggregate(records):
+    """
+    This function aggregates runs by algorithm, mapping and method
+    :param records: list of dictionaries
+    :return: dictionary { key of the group => statistics }, where duration is the median over successful runs
+             and memory is the maximum over successful runs (None if there is no value)
+    """
+    groups = {}
+    for r in records:
+        groups.setdefault(group_key(r), []).append(r)
+    statistics = {}
+    for key, runs in groups.items():
+        ok = [r for r in runs if r.get('status') == 'OK']
+        durations = [r['duration'] for r in ok if isinstance(r.get('duration'), (int, float))]
+        memory = [r['max_memory'] for r in ok if isinstance(r.get('max_memory'), (int, float)) and r['max_memory'] >= 0]
+        statistics[key] = {
+            'runs': len(runs),
+            'ok': len(ok),
+            'duration': median(durations) if durations else None,
+            'max_memory': max(memory) if memory else None
+        }
+    return statistics
+
+
+def delta(old, new):
+    """
+    This function returns relative change (in percents) between two values
+    """
+    if old is None or new is None or old == 0:
+        return None
+    return 100 * (new - old) / old
+
+
+def _format(value, digits=2, suffix=''):
+    if value is None:
+        return '-'
+    return f'{value:.{digits}f}{suffix}'
+
+
+def print_table(header, rows):
+    """
+    This function prints table with columns aligned to the widest value
+    """
+    widths = [max(len(str(row[i])) for row in [header] + rows) for i in range(len(header))]
+    for row in [header] + rows:
+        print('  '.join(str(value).ljust(width) for value, width in zip(row, widths)))
+
+
+def summary(records):
+    """
+    This function prints statistics of runs grouped by algorithm, mapping and method
+    """
+    rows = [list(key) + [s['runs'], s['ok'], _format(s['duration'], 4), _format(s['max_memory'])]
+            for key, s in sorted(aggregate(records).items())]
+    print_table(list(GROUP_BY) + ['runs', 'ok', 'duration', 'max_memory'], rows)
+
+
+def compare(old_records, new_records):
+    """
+    This function prints durations and memory usage of two sets of runs (e.g. two revisions) and their deltas,
+    only groups present in both sets are compared
+    """
+    old, new = aggregate(old_records), aggregate(new_records)
+    rows = []
+    for key in sorted(old.keys() & new.keys()):
+        a, b = old[key], new[key]
+        rows.append(list(key) + [
+            _format(a['duration'], 4), _format(b['duration'], 4), _format(delta(a['duration'], b['duration']), 1, '%'),
+            _format(a['max_memory']), _format(b['max_memory']), _format(delta(a['max_memory'], b['max_memory']), 1, '%')
+        ])
+    print_table(list(GROUP_BY) + ['duration A', 'duration B', 'delta', 'memory A', 'memory B', 'delta'], rows)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(
+            prog="python query_log.py",
+            formatter_class=RawDescriptionHelpFormatter,
+            epilog=textwrap.dedent('''
+            This is application to aggregate and compare results logged by main.py and batch.py.
+
+            For details see file README.md.
+            '''))
+    parser.add_argument(
+            "files",
+            metavar="FILE",
+            nargs='*',
+            type=str,
+            help=f"Log files (JSON lines or old format), default value is {LOG_FILE}",
+            default=[LOG_FILE]
+    )
+    parser.add_argument(
+            "-a", "--algorithm",
+            metavar="ALG",
+            nargs='+',
+            type=str,
+            help="Take only runs of these algorithms",
+            default=None
+    )
+    parser.add_argument(
+            "-m", "--mapping",
+            metavar="MAPPING",
+            nargs='+',
+            type=str,
+            help="Take only runs for these mappings",
+            default=None
+    )
+    parser.add_argument(
+            "-e", "--method",
+            metavar="METHOD",
+            nargs='+',
+            type=str,
+            help="Take only runs of these methods",
+            default=None
+    )
+    parser.add_argument(
+            "--revision",
+            metavar="REV",
+            nargs=1,
+            type=str,
+            help="Take only runs of git revision starting with REV",
+            default=None
+    )
+    parser.add_argument(
+            "--compare",
+            metavar=("A", "B"),
+            nargs=2,
+            type=str,
+            help="Compare runs A with runs B, where A and B are log files or prefixes of git revisions " +
+                 "(runs of these revisions are taken from FILE)",
+            default=None
+    )
+    args = parser.parse_args()
+
+    filters = {
+        'list_of_algorithms': args.algorithm,
+        'list_of_mappings': args.mapping,
+        'list_of_methods': args.method
+    }
+    if args.compare is None:
+        records = [r for path in args.files for r in read_records(path)]
+        summary(select(records, revision_prefix=args.revision[0] if args.revision else None, **filters))
+    else:
+        sides = []
+        for side in args.compare:
+            if os.path.exists(side):
+                sides.append(select(read_records(side), **filters))
+            else:
+                records = [r for path in args.files for r in read_records(path)]
+                sides.append(select(records, revision_prefix=side, **filters))
+        compare(*sides)
@@ -0,0 +1,123 @@
+"""
+This file contains persistent cache of results of inversions (whole inverses and inverses of reduced mappings).
+Entries are addressed by hash of their description (mapping fingerprint, algorithm, method, prime, ...)
+and stored as compressed pickles. Least recently used entries are removed when the cache exceeds its size.
+See details in README.md file.
+"""
+import os
+import zlib
+import pickle
+import hashlib
+
+
+# default size limit (in MB) of the cache
+RESULT_CACHE_SIZE = 1024
+# extension of files with cached results
+EXTENSION = '.result'
+# options which don't change the result (they aren't part of the key in the result cache),
+# they only select resources used by the algorithm (processes, memory of dense arrays, ...)
+NON_RESULT_OPTIONS = ['workers', 'dense_memory', 'checkpoints', 'tracer']
+
+
+def describe(f):
+    """
+    This function returns description of function used as part of cache key,
+    for partial functions the bound keyword arguments are included (except NON_RESULT_OPTIONS)
+    :param f: function, partial function or None
+    :return: tuple describing the function
+    """
+    if f is None:
+        return None,
+    if hasattr(f, 'func'):
+        keywords = sorted((k, v) for k, v in f.keywords.items() if k not in NON_RESULT_OPTIONS)
+        return describe(f.func) + tuple(keywords) + tuple(f.args)
+    return f.__module__, f.__name__
+
+
+class ResultCache:
+    """
+    Class storing results of inversions on disk, shared by all runs of the program
+    """
+
+    def __init__(self, directory, size_limit=RESULT_CACHE_SIZE):
+        """
+        :param directory: directory with cached results
+        :param size_limit: how much disk space (in MB) can be utilized by the cache
+        """
+        self.directory = directory
+        self.size_limit = size_limit * 2**20
+
+    @staticmethod
+    def key(*parts):
+        """
+        This method calculates key of the entry
+        :param parts: description of the result (must have deterministic representation)
+        :return: hexadecimal string
+        """
+        return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + EXTENSION)
+
+    def get(self, key):
+        """
+        This method returns cached result
+        :param key: key of the entry
+        :return: cached result or None if there is no such entry
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.loads(zlib.decompress(f.read()))
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, zlib.error, pickle.UnpicklingError):
+            # broken entry (e.g. written by interrupted process) is treated as missing
+            return None
+        try:
+            # modification time is used as time of last use by eviction
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def put(self, key, value):
+        """
+        This method stores result in the cache and evicts least recently used entries if needed
+        :param key: key of the entry
+        :param value: result (any picklable object)
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        temporary_path = f'{path}.{os.getpid()}'
+        with open(temporary_path, 'wb') as f:
+            f.write(zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), 9))
+        os.replace(temporary_path, path)
+        self.evict(keep=path)
+
+    def evict(self, keep=None):
+        """
+        This method removes least recently used entries until the cache fits its size limit
+        :param keep: path of the entry which is never removed (e.g. just stored one)
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(EXTENSION):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.size_limit:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
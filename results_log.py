@@ -0,0 +1,134 @@
+"""
+This file contains append-only log of results in JSON lines format. Every record contains result of one run
+of the algorithm together with description of environment (host, versions of Python and Sage, git revision),
+so results of many runs (and different revisions of our program) can be compared (see query_log.py).
+Lines of the old log format (date followed by Python dictionary) are also read.
+See details in README.md file.
+"""
+import os
+import ast
+import json
+import numbers
+import platform
+import subprocess
+from datetime import datetime
+
+
+# default log file
+LOG_FILE = "log.jsonl"
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def now():
+    """
+    This function returns current time in format used by logs
+    """
+    return datetime.now().strftime(TIME_FORMAT)
+
+
+def git_revision():
+    """
+    This function returns git revision of our program
+    :return: tuple (hash of commit, flag if there are uncommitted changes) or (None, None) outside of repository
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    try:
+        revision = subprocess.run(["git", "rev-parse", "HEAD"], cwd=directory, capture_output=True,
+                                  text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=directory,
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return revision, status != ""
+
+
+def sage_version():
+    """
+    This function returns version of Sage (None if it isn't available)
+    """
+    try:
+        from sage.version import version
+    except ImportError:
+        return None
+    return version
+
+
+def environment():
+    """
+    This function describes environment in which the algorithms are executed
+    :return: dictionary
+    """
+    revision, dirty = git_revision()
+    return {
+        'host': platform.node(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'python': platform.python_version(),
+        'sage': sage_version(),
+        'revision': revision,
+        'dirty': dirty
+    }
+
+
+def to_json(value):
+    """
+    This function converts values which aren't supported by JSON (e.g. Sage and NumPy numbers),
+    integers stay integers
+    """
+    if isinstance(value, numbers.Integral):
+        return int(value)
+    if isinstance(value, numbers.Real):
+        return float(value)
+    return str(value)
+
+
+def write_record(log_file, record):
+    """
+    This function appends record to the log
+    :param log_file: file opened for appending
+    :param record: dictionary
+    :return: written line
+    """
+    msg = json.dumps(record, default=to_json)
+    log_file.write(msg + "\n")
+    log_file.flush()
+    return msg
+
+
+def parse_line(line):
+    """
+    This function parses line of the log (JSON or old format: date, time and Python dictionary or None)
+    :param line: line of the log
+    :return: dictionary or None if the line is broken (e.g. written by interrupted program)
+    """
+    line = line.strip()
+    if not line:
+        return None
+    if line.startswith('{'):
+        try:
+            return json.loads(line)
+        except ValueError:
+            return None
+    parts = line.split(' ', 2)
+    if len(parts) < 3:
+        return None
+    try:
+        result = ast.literal_eval(parts[2])
+    except (ValueError, SyntaxError):
+        return None
+    if result is None:
+        # old program logged None when the algorithm failed
+        result = {'status': 'ERROR'}
+    if not isinstance(result, dict):
+        return None
+    return {'end': f'{parts[0]} {parts[1]}', **result}
+
+
+def read_records(path):
+    """
+    This function reads all records of the log
+    :param path: path to the log file
+    :return: list of dictionaries
+    """
+    with open(path) as f:
+        return [record for record in map(parse_line, f) if record is not None]
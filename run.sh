@@ -1,46 +1,12 @@
 #!/bin/bash
 
-sage main.py -a ABCH -m EX17 -v -j -t 3600 -r 20480
-sage main.py -a ABCH_CRT -m EX17 -v -j -t 3600 -r 20480
-
-sage main.py -a ABCH -m EX19 -v -j -t 3600 -r 20480
-sage main.py -a ABCH_CRT -m EX19 -v -j -t 3600 -r 20480
-
-sage main.py -a ABCH -m EX20 -v -j -t 3600 -r 20480
-sage main.py -a ABCH_CRT -m EX20 -v -j -t 3600 -r 20480
-
-sage main.py -a GB_SAGE -m EX17 -v -j -t 3600 -r 20480
-sage main.py -a GB_SAGE_CRT -m EX17 -v -j -t 3600 -r 20480
-
-sage main.py -a GB_SAGE -m EX19 -v -j -t 3600 -r 20480
-sage main.py -a GB_SAGE_CRT -m EX19 -v -j -t 3600 -r 20480
-
-sage main.py -a GB_SAGE -m EX20 -v -j -t 3600 -r 20480
-sage main.py -a GB_SAGE_CRT -m EX20 -v -j -t 3600 -r 20480
-
-sage main.py -a GB_maple -m EX17 -v -j -t 3600 -r 20480
-sage main.py -a GB_maple -m EX17 -v -j -t 3600 -r 20480 -e fgb
-sage main.py -a GB_maple -m EX17 -v -j -t 3600 -r 20480 -e maplef4
-sage main.py -a GB_maple -m EX17 -v -j -t 3600 -r 20480 -e buchberger
-sage main.py -a GB_maple -m EX17 -v -j -t 3600 -r 20480 -e fglm
-sage main.py -a GB_maple -m EX17 -v -j -t 3600 -r 20480 -e walk
-sage main.py -a GB_maple -m EX17 -v -j -t 3600 -r 20480 -e direct
-sage main.py -a GB_maple -m EX17 -v -j -t 3600 -r 20480 -e convert
-
-sage main.py -a GB_maple -m EX19 -v -j -t 3600 -r 20480
-sage main.py -a GB_maple -m EX19 -v -j -t 3600 -r 20480 -e fgb
-sage main.py -a GB_maple -m EX19 -v -j -t 3600 -r 20480 -e maplef4
-sage main.py -a GB_maple -m EX19 -v -j -t 3600 -r 20480 -e buchberger
-sage main.py -a GB_maple -m EX19 -v -j -t 3600 -r 20480 -e fglm
-sage main.py -a GB_maple -m EX19 -v -j -t 3600 -r 20480 -e walk
-sage main.py -a GB_maple -m EX19 -v -j -t 3600 -r 20480 -e direct
-sage main.py -a GB_maple -m EX19 -v -j -t 3600 -r 20480 -e convert
-
-sage main.py -a GB_maple -m EX20 -v -j -t 3600 -r 20480
-sage main.py -a GB_maple -m EX20 -v -j -t 3600 -r 20480 -e fgb
-sage main.py -a GB_maple -m EX20 -v -j -t 3600 -r 20480 -e maplef4
-sage main.py -a GB_maple -m EX20 -v -j -t 3600 -r 20480 -e buchberger
-sage main.py -a GB_maple -m EX20 -v -j -t 3600 -r 20480 -e fglm
-sage main.py -a GB_maple -m EX20 -v -j -t 3600 -r 20480 -e walk
-sage main.py -a GB_maple -m EX20 -v -j -t 3600 -r 20480 -e direct
-sage main.py -a GB_maple -m EX20 -v -j -t 3600 -r 20480 -e convert
+# experiments from our paper, jobs are executed one by one (see batch.py) - every job may use
+# up to 20 GB of memory and concurrent jobs would disturb the measured times,
+# rerunning the script skips jobs which already have results in batch.jsonl
+sage batch.py \
+    -a ABCH ABCH_CRT GB_SAGE GB_SAGE_CRT GB_MAPLE \
+    -m EX17 EX19 EX20 \
+    -e "" fgb maplef4 buchberger fglm walk direct convert \
+    -v exact -j exact -t 3600 -r 20480 \
+    --cores 1 \
+    --resume
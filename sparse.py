@@ -0,0 +1,250 @@
+"""
+This file contains implementation of ABCH algorithm for mappings defined over prime fields GF(p),
+in which sparse polynomials are stored as two parallel lists: packed monomials and coefficients.
+Exponents of monomial are packed into one integer together with its degree (in the highest bits),
+so degree tests and multiplication of monomials are operations on integers and sorting by packed
+monomials sorts terms by degree (truncation to lower degree is just a prefix of the lists).
+See details in README.md file.
+"""
+from sage.all import *
+import sys
+from time import time
+from bisect import bisect_right
+from tracer import StepTimer, phase, TIME_DIGITS
+
+
+def is_sparse_applicable(mapping):
+    """
+    This function checks if mapping can be inverted by SparseEngine
+    :param mapping: object defining mapping to inverse
+    :return: True if mapping is defined over prime field and it isn't the identity
+    """
+    field = mapping.R.base_ring()
+    return field.is_finite() and field.is_prime_field() and mapping.degree_limit() >= 1
+
+
+class SparseEngine:
+    """
+    Class performing ABCH algorithm on sparse polynomials with packed exponents modulo prime number.
+    Polynomial is a tuple (monomials, coefficients) of lists sorted by packed monomials,
+    coefficients are integers in range 1..p-1.
+    """
+
+    def __init__(self, mapping):
+        """
+        :param mapping: object defining mapping to inverse, it has to be defined over GF(p)
+        """
+        self.mapping = mapping
+        self.n = mapping.n
+        self.q = int(mapping.R.base_ring().characteristic())
+        self.degree_limit = mapping.degree_limit()
+        # product of two truncated monomials has exponents and degree at most 2 * degree_limit,
+        # so it never overflows into the neighbouring field
+        self.width = (2 * self.degree_limit).bit_length()
+        self.mask = (1 << self.width) - 1
+        self.degree_shift = self.n * self.width
+        self.images = [self.from_polynomial(f) for f in mapping.F]
+
+    def pack(self, exponents):
+        """
+        This method packs exponents of monomial into one integer
+        :param exponents: list of exponents in monomial
+        :return: packed monomial
+        """
+        key = sum(exponents) << self.degree_shift
+        for index, e in enumerate(exponents):
+            key |= e << (index * self.width)
+        return key
+
+    def unpack(self, key):
+        """
+        This method unpacks exponents of monomial
+        :param key: packed monomial
+        :return: tuple of exponents
+        """
+        return tuple((key >> (index * self.width)) & self.mask for index in range(self.n))
+
+    def degree(self, key):
+        """
+        This method returns degree of packed monomial
+        """
+        return key >> self.degree_shift
+
+    def exponent(self, key, index):
+        """
+        This method returns exponent of index-th variable in packed monomial
+        """
+        return (key >> (index * self.width)) & self.mask
+
+    def _prefix(self, monomials, degree_limit):
+        """
+        This method returns number of terms of degree at most degree_limit
+        """
+        if degree_limit < 0:
+            return 0
+        return bisect_right(monomials, ((degree_limit + 1) << self.degree_shift) - 1)
+
+    def _normalize(self, terms):
+        """
+        This method converts dictionary { packed monomial => coefficient } into polynomial
+        """
+        monomials = sorted(k for k, c in terms.items() if c % self.q != 0)
+        return monomials, [terms[k] % self.q for k in monomials]
+
+    def from_polynomial(self, p):
+        """
+        This method converts Sage polynomial into sparse polynomial
+        :param p: n-variable polynomial
+        :return: tuple (monomials, coefficients)
+        """
+        return self._normalize({self.pack(m): int(ZZ(c)) for m, c in p.dict().items()})
+
+    def to_polynomial(self, a):
+        """
+        This method converts sparse polynomial into Sage polynomial
+        :param a: tuple (monomials, coefficients)
+        :return: n-variable polynomial
+        """
+        monomials, coefficients = a
+        return self.mapping.R({self.unpack(k): c for k, c in zip(monomials, coefficients)})
+
+    def add(self, a, b, sign=1):
+        """
+        This method adds (or subtracts) two sparse polynomials
+        :param a: tuple (monomials, coefficients)
+        :param b: tuple (monomials, coefficients)
+        :param sign: 1 for a + b, -1 for a - b
+        :return: tuple (monomials, coefficients)
+        """
+        terms = dict(zip(*a))
+        for k, c in zip(*b):
+            terms[k] = terms.get(k, 0) + sign * c
+        return self._normalize(terms)
+
+    def subtract(self, a, b):
+        """
+        This method subtracts two sparse polynomials
+        :param a: tuple (monomials, coefficients)
+        :param b: tuple (monomials, coefficients)
+        :return: tuple (monomials, coefficients) of a - b
+        """
+        return self.add(a, b, -1)
+
+    def multiply(self, a, b, degree_limit):
+        """
+        This method multiplies two sparse polynomials, terms of degree higher than degree_limit are never created
+        :param a: tuple (monomials, coefficients)
+        :param b: tuple (monomials, coefficients)
+        :param degree_limit: boundary for degree
+        :return: tuple (monomials, coefficients)
+        """
+        if len(a[0]) < len(b[0]):
+            a, b = b, a
+        a_monomials, a_coefficients = a
+        terms = {}
+        for kb, cb in zip(*b):
+            length = self._prefix(a_monomials, degree_limit - self.degree(kb))
+            for ka, ca in zip(a_monomials[:length], a_coefficients[:length]):
+                k = ka + kb
+                terms[k] = terms.get(k, 0) + ca * cb
+        return self._normalize(terms)
+
+    def _compose(self, terms, index, degree_limit):
+        """
+        This method calculates truncated value of polynomial given by list of terms for arguments F_1, ..., F_n.
+        Horner scheme is used with respect to variable with given index, the remaining variables are handled
+        recursively.
+        :param terms: list of tuples (packed monomial, coefficient), exponents of variables before index are ignored
+        :param index: index of the variable
+        :param degree_limit: boundary for degree
+        :return: tuple (monomials, coefficients)
+        """
+        if index == self.n:
+            return self._normalize({0: sum(c for _, c in terms)})
+        groups = {}
+        for k, c in terms:
+            groups.setdefault(self.exponent(k, index), []).append((k, c))
+        result = ([], [])
+        for e in range(max(groups), -1, -1):
+            # result will be multiplied by F_index^e, so terms above degree_limit - e are not needed
+            if result[0]:
+                result = self.multiply(result, self.images[index], degree_limit - e)
+            if e in groups:
+                result = self.add(result, self._compose(groups[e], index + 1, degree_limit - e))
+        return result
+
+    def compose(self, a):
+        """
+        This method calculates value of sparse polynomial for arguments defined in mapping F
+        :param a: tuple (monomials, coefficients)
+        :return: tuple (monomials, coefficients) of p(F) without terms of degree higher than degree limit
+        """
+        if not a[0]:
+            return a
+        return self._compose(list(zip(*a)), 0, self.degree_limit)
+
+    def inverse_coordinate(self, index, debug, tracer=None):
+        """
+        This method obtains an inverse of index-th coordinate of mapping F (see function inverse_algorithm)
+        :param index: index of coordinate to inverse
+        :param debug: flag if debug should be printed to standard output
+        :param tracer: Tracer recording every step, if None steps are not recorded
+        :return: G_index - index-th coordinate of global inverse mapping G
+        """
+        x = self.mapping.R.gens()[index]
+        if debug:
+            print('---------------------------------------------')
+            print(f'Executing algorithm for {x} (sparse)')
+        _, _, lower_degrees = self.mapping.degrees()
+        if lower_degrees[index] == sys.maxsize:
+            if debug:
+                print('There is no need to perform the algorithm')
+            return x
+        steps_limit = self.mapping.steps_limit(index)
+        if debug:
+            print(f'Maximum number of steps: {steps_limit}')
+            print(f'Inversion degree boundary: {self.degree_limit}')
+        if tracer is not None:
+            start = time()
+            tracer.record('start', mapping=self.mapping.name, coordinate=index, steps_limit=steps_limit,
+                          degree_limit=self.degree_limit)
+        p = self.from_polynomial(x)
+        result = p
+        step = 1
+        while True:
+            timer = StepTimer() if tracer is not None else None
+            with phase(timer, 'substitution'):
+                image = self.compose(p)
+            p = self.subtract(p, image)
+            result = self.add(result, p)
+            if tracer is not None:
+                tracer.record('step', mapping=self.mapping.name, coordinate=index, step=step, terms=len(p[0]),
+                              degree=self.degree(p[0][-1]) if p[0] else None,
+                              ldegree=self.degree(p[0][0]) if p[0] else None, **timer.summary())
+            if not p[0]:
+                if debug:
+                    print(f'P_{step} = 0')
+                reason = 'zero'
+                break
+            if debug:
+                print(f'P_{step} has degree: {self.degree(p[0][-1])}, ldegree: {self.degree(p[0][0])}, ' +
+                      f'length: {len(p[0])}')
+            if step == steps_limit:
+                if debug:
+                    print('NOT PASCAL FINITE!')
+                reason = 'steps_limit'
+                break
+            step += 1
+        if tracer is not None:
+            tracer.record('end', mapping=self.mapping.name, coordinate=index, reason=reason, steps=step,
+                          duration=round(time() - start, TIME_DIGITS))
+        return self.to_polynomial(result)
+
+    def inverse(self, debug, tracer=None):
+        """
+        This method obtains all coordinates of the inverse
+        :param debug: flag if debug should be printed to standard output
+        :param tracer: Tracer recording every step, if None steps are not recorded
+        :return: list [G_1, ..., G_n]
+        """
+        return [self.inverse_coordinate(index, debug, tracer) for index in range(self.n)]
@@ -0,0 +1,101 @@
+"""
+This file contains tracer recording progress of ABCH algorithm: one record per coordinate and step
+(wall time, number of terms, degree and lower degree of P_k, time of substitution and truncation, resident memory).
+Records are written to JSON lines file and/or passed to user callback.
+See details in README.md file.
+"""
+import os
+import json
+from time import time
+from contextlib import contextmanager, nullcontext
+from memory import rss, MB, MEMORY_DIGITS
+from results_log import to_json
+
+
+TIME_DIGITS = 6
+
+
+class Tracer:
+    """
+    Class recording events of the algorithm. It is sent to worker processes (method 'parallel', algorithms using CRT),
+    every process appends its records to the same file (the file is opened separately in every process).
+    """
+
+    def __init__(self, path=None, callback=None):
+        """
+        :param path: JSON lines file where records are appended, if None records are not written
+        :param callback: function called with every record (dictionary) in the process which computes it,
+                         if None it isn't called
+        """
+        self.path = path
+        self.callback = callback
+        self._file = None
+
+    def __getstate__(self):
+        """
+        Opened file is not sent to other processes
+        """
+        state = self.__dict__.copy()
+        state['_file'] = None
+        return state
+
+    def __repr__(self):
+        return f'Tracer({self.path!r})'
+
+    def record(self, event, **fields):
+        """
+        This method records event
+        :param event: name of the event ('start', 'step', 'end')
+        :param fields: values describing the event
+        """
+        record = {'event': event, 'time': round(time(), TIME_DIGITS), 'pid': os.getpid(),
+                  'rss': round(rss(os.getpid()) / MB, MEMORY_DIGITS), **fields}
+        if self.path is not None:
+            if self._file is None:
+                self._file = open(self.path, 'a')
+            # one write per record, so records of different processes are not mixed
+            self._file.write(json.dumps(record, default=to_json) + '\n')
+            self._file.flush()
+        if self.callback is not None:
+            self.callback(record)
+
+
+class StepTimer:
+    """
+    Class measuring time spent in phases of one step of the algorithm (e.g. substitution and truncation)
+    """
+
+    def __init__(self):
+        self.start = time()
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name):
+        """
+        This method measures time of the block and adds it to the time of the phase
+        :param name: name of the phase
+        """
+        start = time()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0) + time() - start
+
+    def summary(self):
+        """
+        This method returns duration of the step and times of phases
+        :return: dictionary
+        """
+        return {'duration': round(time() - self.start, TIME_DIGITS),
+                **{k: round(v, TIME_DIGITS) for k, v in self.phases.items()}}
+
+
+def phase(timer, name):
+    """
+    This function returns context measuring time of the phase, if timer is None (tracing is disabled)
+    it does nothing
+    :param timer: StepTimer or None
+    :param name: name of the phase
+    :return: context manager
+    """
+    return nullcontext() if timer is None else timer.phase(name)
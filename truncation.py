@@ -0,0 +1,253 @@
+"""
+This file contains implementation of truncated polynomial arithmetic used by ABCH algorithm.
+Truncated polynomial is stored as a dictionary { k => P_k } where P_k is the homogeneous component
+of degree k. Components of degree higher than degree limit are never computed.
+See details in README.md file.
+"""
+from sage.all import *
+from collections import OrderedDict
+
+
+# default memory limit (in MB) for cache of truncated images of monomials
+POWER_CACHE_MEMORY = 512
+# rough estimate of memory (in bytes) occupied by one term of polynomial, without exponents
+TERM_SIZE = 48
+
+
+def truncate(p, degree_limit):
+    """
+    This function gets the n-variable polynomial p and the number degree_limit
+    and returns the polynomial which consists of terms of degree at most degree_limit.
+    Contrary to filter_terms it builds the result in one pass.
+    :param p: n-variable polynomial
+    :param degree_limit: boundary for degree
+    :return: n-variable polynomial with terms of degree at most limit
+    """
+    return p.parent()({m: c for m, c in p.dict().items() if sum(m) <= degree_limit})
+
+
+def graded(p, degree_limit=None):
+    """
+    This function splits polynomial p into homogeneous components
+    :param p: n-variable polynomial
+    :param degree_limit: components of higher degree are skipped, if None all components are returned
+    :return: truncated polynomial { k => P_k }
+    """
+    components = {}
+    for m, c in p.dict().items():
+        k = sum(m)
+        if degree_limit is None or k <= degree_limit:
+            components.setdefault(k, {})[m] = c
+    ring = p.parent()
+    return {k: ring(d) for k, d in components.items()}
+
+
+def ungraded(a, ring):
+    """
+    This function converts truncated polynomial into ordinary polynomial
+    :param a: truncated polynomial { k => P_k }
+    :param ring: polynomial ring of the result
+    :return: n-variable polynomial
+    """
+    return balanced_sum(list(a.values()), ring)
+
+
+def balanced_sum(polynomials, ring):
+    """
+    This function sums list of polynomials pairwise, so big partial sums are not
+    rebuilt each time a small polynomial is added
+    :param polynomials: list of n-variable polynomials
+    :param ring: polynomial ring of the result
+    :return: sum of the polynomials
+    """
+    if len(polynomials) == 0:
+        return ring.zero()
+    while len(polynomials) > 1:
+        polynomials = [polynomials[j] + polynomials[j+1] if j + 1 < len(polynomials) else polynomials[j]
+                       for j in range(0, len(polynomials), 2)]
+    return polynomials[0]
+
+
+def truncated_add(a, b):
+    """
+    This function adds two truncated polynomials
+    :param a: truncated polynomial { k => P_k }
+    :param b: truncated polynomial { k => Q_k }
+    :return: truncated polynomial { k => P_k + Q_k }
+    """
+    result = dict(a)
+    for k, q in b.items():
+        if k in result:
+            s = result[k] + q
+            if s == 0:
+                del result[k]
+            else:
+                result[k] = s
+        else:
+            result[k] = q
+    return result
+
+
+def truncated_multiply(a, b, degree_limit):
+    """
+    This function multiplies two truncated polynomials.
+    Only products of components with sum of degrees at most degree_limit are computed.
+    :param a: truncated polynomial { k => P_k }
+    :param b: truncated polynomial { k => Q_k }
+    :param degree_limit: boundary for degree
+    :return: truncated polynomial { k => sum P_i*Q_j where i+j = k }
+    """
+    result = {}
+    for i, p in a.items():
+        for j, q in b.items():
+            k = i + j
+            if k > degree_limit:
+                continue
+            if k in result:
+                result[k] += p*q
+            else:
+                result[k] = p*q
+    return {k: p for k, p in result.items() if p != 0}
+
+
+def _compose(terms, images, index, degree_limit, ring):
+    """
+    This function calculates truncated value of polynomial given by list of terms for arguments
+    defined in images. Horner scheme is used with respect to variable with given index,
+    the remaining variables are handled recursively.
+    :param terms: list of tuples (exponents, coefficient), exponents of variables before index are ignored
+    :param images: list of truncated polynomials [F_1, ..., F_n]
+    :param index: index of the variable
+    :param degree_limit: boundary for degree
+    :param ring: polynomial ring of the result
+    :return: truncated polynomial
+    """
+    if index == len(images):
+        c = sum(coefficient for _, coefficient in terms)
+        return {0: ring(c)} if c != 0 else {}
+    groups = {}
+    for exponents, coefficient in terms:
+        groups.setdefault(exponents[index], []).append((exponents, coefficient))
+    result = {}
+    for k in range(max(groups), -1, -1):
+        # result will be multiplied by F_index^k, so terms above degree_limit - k are not needed
+        if result:
+            result = truncated_multiply(result, images[index], degree_limit - k)
+        if k in groups:
+            result = truncated_add(result, _compose(groups[k], images, index + 1, degree_limit - k, ring))
+    return result
+
+
+def truncated_compose(p, images, degree_limit):
+    """
+    This function calculates value of polynomial p for arguments defined in images.
+    Terms of degree higher than degree_limit are never created.
+    It is assumed that polynomials in images have no constant terms.
+    :param p: n-variable polynomial
+    :param images: list of truncated polynomials [F_1, ..., F_n]
+    :param degree_limit: boundary for degree
+    :return: truncated polynomial p(F_1, ..., F_n)
+    """
+    terms = list(p.dict().items())
+    if len(terms) == 0:
+        return {}
+    return _compose(terms, images, 0, degree_limit, p.parent())
+
+
+class TruncatedPowerCache:
+    """
+    Class storing truncated images of monomials under mapping F, i.e. truncated polynomials
+    X^a(F) = F_1^a_1 * ... * F_n^a_n. Every image is computed from the image of a shorter monomial,
+    so products of F_i are shared between monomials. Least recently used images are evicted
+    when estimated memory exceeds the limit.
+    """
+
+    def __init__(self, mapping, degree_limit, memory_limit=POWER_CACHE_MEMORY):
+        """
+        :param mapping: object defining mapping to inverse
+        :param degree_limit: boundary for degree
+        :param memory_limit: how much memory (in MB) can be utilized by the cache
+        """
+        self.ring = mapping.R
+        self.degree_limit = degree_limit
+        self.memory_limit = memory_limit * 2**20
+        self.term_size = TERM_SIZE + 4 * mapping.n
+        self.images = mapping.graded_images(degree_limit)
+        self.entries = OrderedDict()
+        self.memory = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _store(self, key, image):
+        size = self.term_size * sum(q.number_of_terms() for q in image.values())
+        self.entries[key] = (image, size)
+        self.memory += size
+        while self.memory > self.memory_limit and len(self.entries) > 1:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.memory -= evicted_size
+            self.evictions += 1
+
+    def image(self, exponents):
+        """
+        This method returns truncated image of monomial X^exponents
+        :param exponents: list of exponents in monomial
+        :return: truncated polynomial
+        """
+        key = tuple(exponents)
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key][0]
+        self.misses += 1
+        # walk down to the longest cached monomial dividing X^exponents (removing last variables first)
+        chain = []
+        current = list(key)
+        image = None
+        while sum(current) > 0:
+            index = max(j for j, a in enumerate(current) if a > 0)
+            chain.append(index)
+            current[index] -= 1
+            if tuple(current) in self.entries:
+                image = self.entries[tuple(current)][0]
+                self.entries.move_to_end(tuple(current))
+                break
+        # and compute the images on the way back
+        for index in reversed(chain):
+            if image is None:
+                image = self.images[index]
+            else:
+                image = truncated_multiply(image, self.images[index], self.degree_limit)
+            current[index] += 1
+            self._store(tuple(current), image)
+        return image
+
+    def substitute(self, p):
+        """
+        This method calculates value of polynomial p for arguments defined in mapping F
+        using cached images of monomials
+        :param p: n-variable polynomial
+        :return: n-variable polynomial p(F) without terms of degree higher than degree limit
+        """
+        terms = []
+        for m, c in p.dict().items():
+            if sum(m) > self.degree_limit:
+                continue
+            if sum(m) == 0:
+                terms.append(self.ring(c))
+                continue
+            terms += [c*q for q in self.image(m).values()]
+        return balanced_sum(terms, self.ring)
+
+    def statistics(self):
+        """
+        This method returns statistics of the cache
+        :return: dictionary with number of hits, misses, evictions, entries and estimated memory (in MB)
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self.entries),
+            'memory': round(self.memory / 2**20, 4)
+        }